@@ -2,16 +2,32 @@
 import streamlit as st
 import pandas as pd
 import os
-from auth import init_db, authenticate, create_user, list_users, delete_user, change_password, set_meta, get_meta, list_metas
-from calculo import calcular_gratificacao
-from pdfgen import generate_pdf_report
-from emailer import send_email
+import time
+from datetime import date
+from auth import init_db, authenticate, create_user, list_users, delete_user, change_password, set_meta, list_metas, list_metas_conflitos, resolver_meta_conflito, get_metas, get_seller_emails
+from cache import RESULTADOS, hash_conteudo
+from lazy import lazy_import
+import instrumentacao
 
-# Inicializa DB (cria admin/admin se necessário)
-init_db()
+# heavy modules (openpyxl, reportlab, smtplib/ssl) load only when an upload,
+# a PDF or an email actually needs them
+ingestao = lazy_import("ingestao")
+pipeline = lazy_import("pipeline")
+pdfgen = lazy_import("pdfgen")
+emailer = lazy_import("emailer")
+historico = lazy_import("historico")
+powerbi = lazy_import("powerbi")
 
 st.set_page_config(page_title="Sistema de Gratificações", layout="wide")
 
+@st.cache_resource
+def init_db_once():
+    """Inicializa o DB (cria admin/admin se necessário) uma vez por processo, não a cada rerun."""
+    init_db()
+    return True
+
+init_db_once()
+
 # ----------------------
 # Helper functions
 # ----------------------
@@ -70,6 +86,11 @@ if user.get('role') == 'ADMIN':
     st.sidebar.markdown("---")
     if st.sidebar.button("Ir para Painel Admin", key="btn_goto_admin"):
         st.experimental_set_query_params(page='admin')
+if user.get('role') in ('ADMIN', 'FINANCEIRO'):
+    if st.sidebar.button("Histórico de cálculos", key="btn_goto_historico"):
+        st.experimental_set_query_params(page='historico')
+    if st.sidebar.button("Upload e cálculo", key="btn_goto_main"):
+        st.experimental_set_query_params(page='main')
 
 # Determine current page
 page = st.experimental_get_query_params().get('page', ['main'])[0]
@@ -119,10 +140,26 @@ if page == 'admin' and user.get('role') == 'ADMIN':
     st.subheader("Lista de Metas")
     metas = list_metas()
     if metas:
-        st.dataframe(pd.DataFrame(metas))
+        st.dataframe(pd.DataFrame(metas).drop(columns='vendedor_chave'))
     else:
         st.info("Nenhuma meta cadastrada ainda.")
 
+    conflitos = list_metas_conflitos()
+    if conflitos:
+        st.warning(f"{len(conflitos)} meta(s) com o mesmo nome de outra (ignorando maiúsculas, acentos e espaços) ficaram fora do cálculo. "
+                   "Escolha, para cada uma, se os valores dela substituem a meta mantida ou se ela é descartada.")
+        st.dataframe(pd.DataFrame(conflitos).set_index('id'))
+        c_id = st.selectbox("Conflito", [c['id'] for c in conflitos],
+                            format_func=lambda i: next(f"#{c['id']} — {c['vendedor']} (mantida: {c['mantida_vendedor']})" for c in conflitos if c['id'] == i),
+                            key="meta_conflito")
+        c_aplicar, c_descartar = st.columns(2)
+        if c_aplicar.button("Usar os valores deste conflito", key="btn_conflito_aplicar"):
+            resolver_meta_conflito(c_id, aplicar=True)
+            st.experimental_rerun()
+        if c_descartar.button("Descartar este conflito", key="btn_conflito_descartar"):
+            resolver_meta_conflito(c_id, aplicar=False)
+            st.experimental_rerun()
+
     st.markdown("---")
     st.subheader("Gerenciar Usuários")
     users = list_users()
@@ -150,84 +187,188 @@ if page == 'admin' and user.get('role') == 'ADMIN':
             else:
                 st.error("Informe o usuário.")
 
+    st.markdown("---")
+    st.subheader("Diagnóstico de desempenho")
+    st.caption("Tempos e contadores de todo o processo (todas as sessões). Desligado, não mede nada; INSTRUMENTACAO=1 liga na partida.")
+    ligado = st.checkbox("Instrumentação ativa", value=instrumentacao.ativo(), key="diag_ativo")
+    if ligado != instrumentacao.ativo():
+        instrumentacao.ativar(ligado)
+    if st.button("Zerar estatísticas", key="btn_diag_reset"):
+        instrumentacao.resetar()
+    diag = instrumentacao.resumo()
+    if diag['tempos']:
+        st.dataframe(pd.DataFrame(diag['tempos']))
+    else:
+        st.info("Nenhuma medição ainda. Ative a instrumentação e use o sistema (upload, PDF, e-mail).")
+    if diag['contadores']:
+        st.dataframe(pd.DataFrame(sorted(diag['contadores'].items()), columns=['contador', 'total']))
+
+# ----------------------
+# Histórico (ADMIN / FINANCEIRO) — agregações feitas em SQL no system.db
+# ----------------------
+elif page == 'historico' and user.get('role') in ('ADMIN', 'FINANCEIRO'):
+    st.header("📈 Histórico de Cálculos")
+    execucoes = historico.listar_execucoes()
+    if not execucoes:
+        st.info("Nenhum cálculo salvo ainda. Salve um cálculo na página de upload.")
+    else:
+        st.subheader("Total pago por período")
+        periodos = historico.totais_por_periodo()
+        if periodos:
+            df_periodos = pd.DataFrame(periodos).set_index('periodo')
+            st.bar_chart(df_periodos['total'])
+            st.dataframe(df_periodos)
+        else:
+            st.info("Os cálculos salvos não têm resultados por vendedor.")
+
+        st.subheader("Acumulado no ano por vendedor")
+        anos = sorted({int(e['periodo'][:4]) for e in execucoes}, reverse=True)
+        ano = st.selectbox("Ano", anos, key="hist_ano")
+        st.dataframe(pd.DataFrame(historico.acumulado_ano(ano)))
+
+        st.subheader("Evolução de um vendedor")
+        vend = st.selectbox("Vendedor", historico.listar_vendedores(), key="hist_vendedor")
+        df_tend = pd.DataFrame(historico.tendencia_vendedor(vend))
+        if len(df_tend):
+            df_tend = df_tend.set_index('periodo')
+            st.line_chart(df_tend[['vendas', 'total']])
+            st.dataframe(df_tend)
+
+        st.subheader("Cálculos salvos")
+        df_exec = pd.DataFrame(execucoes)
+        st.dataframe(df_exec)
+        run_id = st.selectbox("Ver resultados do cálculo", df_exec['id'], format_func=lambda i: f"#{i} — {df_exec.set_index('id').at[i, 'periodo']}", key="hist_run")
+        st.dataframe(pd.DataFrame(historico.resultados_execucao(run_id)))
+
 # ----------------------
 # Main (non-admin) Page — Upload, cálculos, PDF, envio
 # ----------------------
 else:
     st.header("📥 Upload de Vendas e Cálculo de Gratificações")
-    st.markdown("Faça upload da planilha (aba contendo colunas: `VENDEDOR`, `VALOR DE VENDA`)")
-
-    uploaded = st.file_uploader("Escolha um arquivo .xlsx", type=['xlsx','xls'], key="upload_sales_file")
-    if uploaded is not None:
-        try:
-            # read all sheets; use first sheet by default
-            sheets = pd.read_excel(uploaded, sheet_name=None)
-            first_sheet_name = list(sheets.keys())[0]
-            df_raw = sheets[first_sheet_name].copy()
-
-            st.success(f"Arquivo carregado — usando aba: `{first_sheet_name}`")
-            st.dataframe(df_raw.head(50))
-
-            # normalize column names to uppercase stripped
-            col_map = {c.strip().upper(): c for c in df_raw.columns}
-            seller_col = None
-            value_col = None
-            for k, v in col_map.items():
-                if 'VENDEDOR' in k:
-                    seller_col = v
-                if 'VALOR' in k and 'VENDA' in k:
-                    value_col = v
-
-            if seller_col is None or value_col is None:
+
+    fonte = "Planilha Excel"
+    if all(os.environ.get(v) for v in ("POWERBI_TENANT_ID", "POWERBI_CLIENT_ID", "POWERBI_CLIENT_SECRET")):
+        fonte = st.radio("Origem das vendas", ["Planilha Excel", "Power BI"], horizontal=True, key="sales_source")
+
+    proc = None
+    try:
+        if fonte == "Power BI":
+            st.markdown("Vendas lidas direto do dataset do Power BI (consulta paginada).")
+            pbi_dataset = st.text_input("Dataset ID", value=os.environ.get("POWERBI_DATASET_ID", ""), key="pbi_dataset")
+            pbi_workspace = st.text_input("Workspace ID (vazio: Meu workspace)", value=os.environ.get("POWERBI_WORKSPACE_ID", ""), key="pbi_workspace")
+            pbi_cols = st.columns(4)
+            pbi_tabela = pbi_cols[0].text_input("Tabela", value="Vendas", key="pbi_table")
+            pbi_vendedor = pbi_cols[1].text_input("Coluna vendedor", value="Vendedor", key="pbi_seller_col")
+            pbi_valor = pbi_cols[2].text_input("Coluna valor", value="Valor", key="pbi_value_col")
+            pbi_ordem = pbi_cols[3].text_input("Coluna id (ordem)", value="Id", key="pbi_order_col")
+            if st.button("Carregar do Power BI", key="btn_load_powerbi") and pbi_dataset.strip():
+                # a new load gets a new cache key: the dataset changes over time,
+                # while reruns keep using the loaded snapshot
+                st.session_state['powerbi_key'] = ('powerbi', pbi_dataset.strip(), pbi_workspace.strip() or None,
+                                                   pbi_tabela, pbi_vendedor, pbi_valor, pbi_ordem, time.time())
+            cache_key = st.session_state.get('powerbi_key')
+            if cache_key is not None:
+                proc = RESULTADOS.get(cache_key)
+                if proc is None:
+                    _, ds, ws, tabela, col_vend, col_valor, col_ordem, _ = cache_key
+                    consulta = powerbi.ConsultaPowerBI(powerbi.PowerBIClient.from_env(), ds, tabela, col_vend, col_valor, col_ordem, workspace_id=ws)
+                    with st.spinner("Consultando o Power BI..."), instrumentacao.medir('app.processar_powerbi'):
+                        proc = RESULTADOS.put(cache_key, pipeline.processar_powerbi(consulta, manter_linhas=True, medir_memoria=True))
+                origem_nome, origem_hash = f"powerbi:{cache_key[1]}", None
+                st.success(f"Dados carregados do Power BI — tabela `{proc.sheet_name}`")
+        else:
+            st.markdown("Faça upload da planilha (aba contendo colunas: `VENDEDOR`, `VALOR DE VENDA`)")
+            uploaded = st.file_uploader("Escolha um arquivo .xlsx", type=['xlsx','xls'], key="upload_sales_file")
+            if uploaded is not None:
+                # parsed sheet + results are cached by file content hash, so widget
+                # reruns don't re-read or recalculate the upload; meta changes are
+                # recalculated per seller by pipeline.sincronizar_metas below
+                file_hash = hash_conteudo(uploaded)
+                abas = RESULTADOS.get((file_hash, 'abas')) or RESULTADOS.put((file_hash, 'abas'), ingestao.listar_abas(uploaded))
+                aba = st.selectbox("Aba da planilha", abas, key="upload_sheet") if len(abas) > 1 else abas[0]
+                cache_key = (file_hash, aba)
+                proc = RESULTADOS.get(cache_key)
+                if proc is None:
+                    # read only the chosen sheet, in read-only/streaming mode
+                    with instrumentacao.medir('app.processar_planilha'):
+                        proc = RESULTADOS.put(cache_key, pipeline.processar_planilha(uploaded, aba, manter_linhas=True, medir_memoria=True))
+                origem_nome, origem_hash = uploaded.name, file_hash
+                st.success(f"Arquivo carregado — usando aba: `{proc.sheet_name}`")
+
+        if proc is not None:
+            if proc.amostra is not None:
+                st.dataframe(proc.amostra)
+
+            if proc.resultado is None:
                 st.error("Não foi possível identificar automaticamente as colunas 'VENDEDOR' e 'VALOR DE VENDA'. Renomeie-as e envie novamente.")
             else:
-                # prepare rows for calculation
-                results = []
-                total_paid = 0.0
-                for _, row in df_raw.iterrows():
-                    vendedor = str(row.get(seller_col)).strip() if pd.notna(row.get(seller_col)) else ""
-                    raw_vendas = row.get(value_col)
-                    # normalize numeric values (handle strings with R$ etc)
-                    vendas = None
-                    try:
-                        # if it's string like "R$ 1.234,56", try to clean
-                        if isinstance(raw_vendas, str):
-                            vstr = raw_vendas.replace("R$", "").replace(".", "").replace(",", ".").strip()
-                            vendas = float(vstr) if vstr not in ["", "-"] else None
+                # copy-on-write: the cached entry is swapped, never patched in place
+                resultado, recalculados = pipeline.sincronizar_metas(
+                    proc.resultado, publicar=lambda novo: RESULTADOS.put(cache_key, proc._replace(resultado=novo)))
+                if recalculados:
+                    st.info(f"Metas alteradas: {len(recalculados)} vendedor(es) recalculado(s).")
+                df_results, df_invalidos, df_linhas = resultado.resultados, resultado.invalidos, resultado.linhas
+                total_paid = float(df_results['total'].sum())
+                results = pipeline.resultados_para_linhas(df_results)
+                st.caption(f"{proc.linhas_lidas} linhas lidas (colunas `{proc.seller_col}` / `{proc.value_col}`)"
+                           + (f" — pico de memória do processamento: {proc.pico_mb:.1f} MB" if proc.pico_mb is not None else ""))
+                if len(df_invalidos):
+                    st.warning(f"{len(df_invalidos)} linha(s) com 'VALOR DE VENDA' inválido foram consideradas sem venda.")
+                    with st.expander("Ver linhas com valor inválido"):
+                        st.dataframe(df_invalidos)
+                st.subheader("Resultados por vendedor")
+                st.metric("Total a pagar", f"R$ {total_paid:,.2f}")
+                with instrumentacao.medir('app.st_dataframe_resultados'):
+                    st.dataframe(df_results.reset_index(drop=True))
+
+                if user.get('role') == 'ADMIN':
+                    with st.expander("Ajustar meta de um vendedor (recalcula só esse vendedor)"):
+                        # linhas sem vendedor (chave '') não têm meta própria
+                        vendedores = df_results.index[df_results.index != '']
+                        if not len(vendedores):
+                            st.info("Nenhum vendedor identificado na planilha.")
                         else:
-                            vendas = float(raw_vendas) if pd.notna(raw_vendas) else None
-                    except Exception:
-                        vendas = None
-
-                    meta = get_meta(vendedor) or {}
-                    meta_min = meta.get('meta_min') if meta.get('meta_min') is not None else 0.0
-                    meta_100 = meta.get('meta_100') if meta.get('meta_100') is not None else 0.0
-                    grat100 = meta.get('gratificacao_100') if meta.get('gratificacao_100') is not None else 0.0
-                    bonus_pct = meta.get('bonus_pct') if meta.get('bonus_pct') is not None else 0.0
-
-                    calc = calcular_gratificacao(vendas, meta_min, meta_100, grat100, bonus_pct)
-                    results.append({
-                        'vendedor': vendedor or '(sem nome)',
-                        'vendas': round(vendas,2) if vendas is not None else 0.0,
-                        'meta_100': meta_100,
-                        'atingimento': calc['atingimento'],
-                        'grat_base': calc['grat_base'],
-                        'bonus': calc['bonus'],
-                        'total': calc['total']
-                    })
-                    total_paid += calc['total']
-
-                df_results = pd.DataFrame(results)
-                st.subheader("Resultados")
-                st.dataframe(df_results)
+                            q_vend = st.selectbox("Vendedor", vendedores, format_func=lambda k: df_results.at[k, 'vendedor'], key="quick_meta_vendedor")
+                            # all fields prefilled from the saved meta and saved together: no partial rows
+                            q_nome = df_results.at[q_vend, 'vendedor']
+                            atual = get_metas([q_nome])[q_nome] or {}
+                            q_meta_min = st.number_input("Meta mínima (R$)", min_value=0.0, value=float(atual.get('meta_min') or 0.0), step=100.0, key=f"quick_meta_min_{q_vend}")
+                            q_meta_100 = st.number_input("Meta 100% (R$)", min_value=0.0, value=float(atual.get('meta_100') or 10000.0), step=100.0, key=f"quick_meta_100_{q_vend}")
+                            q_grat100 = st.number_input("Gratificação ao atingir 100% (R$)", min_value=0.0, value=float(atual.get('gratificacao_100') or 500.0), step=1.0, key=f"quick_meta_grat100_{q_vend}")
+                            q_bonus = st.number_input("Bônus % sobre excedente (ex: 0.10 = 10%)", min_value=0.0, value=float(atual.get('bonus_pct') or 0.0), step=0.01, format="%f", key=f"quick_meta_bonus_{q_vend}")
+                            if st.button("Salvar e recalcular", key="btn_quick_meta"):
+                                set_meta(q_nome, q_meta_min, q_meta_100, q_grat100, q_bonus)
+                                st.experimental_rerun()
+
+                if user.get('role') in ('ADMIN', 'FINANCEIRO'):
+                    with st.expander("Salvar no histórico"):
+                        hoje = date.today()
+                        periodo = st.text_input("Período (AAAA-MM)", value=f"{hoje.year:04d}-{hoje.month:02d}", key="hist_periodo")
+                        st.caption("Salvar de novo um período substitui o cálculo salvo anteriormente para ele.")
+                        if st.button("Salvar cálculo", key="btn_save_history"):
+                            try:
+                                run_id = historico.salvar_execucao(periodo, df_results, criado_por=user.get('username'),
+                                                                   arquivo=origem_nome, arquivo_hash=origem_hash)
+                                st.success(f"Cálculo #{run_id} salvo para {periodo.strip()}.")
+                            except ValueError as e:
+                                st.error(str(e))
+
+                if st.checkbox("Mostrar detalhamento por linha", key="show_line_detail"):
+                    vend_sel = st.selectbox("Vendedor", df_results.index, format_func=lambda k: df_results.at[k, 'vendedor'], key="line_detail_seller")
+                    st.dataframe(df_linhas.loc[df_linhas['chave'] == vend_sel, ['linha', 'vendas']].reset_index(drop=True))
 
                 st.markdown("---")
                 st.subheader("Gerar Relatório PDF")
                 if st.button("Gerar PDF (download local)", key="btn_gen_pdf"):
-                    out_file = "relatorio_gratificacoes.pdf"
-                    generate_pdf_report(out_file, "Relatório de Gratificações", results, totals=round(total_paid,2), footer_text="Relatório gerado automaticamente.")
-                    with open(out_file, "rb") as f:
-                        st.download_button("Baixar PDF", f, file_name=out_file, mime="application/pdf", key="download_pdf")
+                    # generated in memory: nothing is written to the working directory
+                    pdf_bytes = pdfgen.generate_pdf_report(None, "Relatório de Gratificações", results, totals=round(total_paid,2), footer_text="Relatório gerado automaticamente.")
+                    st.download_button("Baixar PDF", pdf_bytes, file_name="relatorio_gratificacoes.pdf", mime="application/pdf", key="download_pdf")
+
+                if st.button("Gerar demonstrativos por vendedor (ZIP)", key="btn_gen_zip"):
+                    # one PDF per seller, rendered across a process pool (PDF_WORKERS)
+                    with st.spinner(f"Gerando {len(results)} demonstrativos..."):
+                        zip_bytes = pdfgen.generate_statements_zip(None, results)
+                    st.download_button("Baixar ZIP", zip_bytes, file_name="demonstrativos_gratificacoes.zip", mime="application/zip", key="download_zip")
 
                 st.markdown("---")
                 st.subheader("Enviar por E-mail (teste)")
@@ -239,16 +380,33 @@ else:
                 sender = st.text_input("From (ex: Relatorios <rel@empresa.com>)", value=os.environ.get("EMAIL_FROM","no-reply@example.com"), key="smtp_from")
                 recipients = st.text_area("Destinatários (vírgula separado)", value=os.environ.get("RECIPIENTS","gestor@empresa.com"), key="smtp_recipients")
                 if st.button("Gerar PDF e Enviar (teste)", key="btn_send_email"):
-                    out_file = "relatorio_envio.pdf"
-                    generate_pdf_report(out_file, "Relatório de Gratificações", results, totals=round(total_paid,2), footer_text="Relatório gerado automaticamente.")
+                    pdf_bytes = pdfgen.generate_pdf_report(None, "Relatório de Gratificações", results, totals=round(total_paid,2), footer_text="Relatório gerado automaticamente.")
                     try:
                         recips = [r.strip() for r in recipients.split(",") if r.strip()]
-                        send_email(smtp_host, smtp_port, smtp_user, smtp_pass, sender, recips, "Relatório de Gratificações", "Segue em anexo o relatório.", out_file)
+                        emailer.send_email(smtp_host, smtp_port, smtp_user, smtp_pass, sender, recips, "Relatório de Gratificações", "Segue em anexo o relatório.",
+                                   attachment=pdf_bytes, attachment_name="relatorio_gratificacoes.pdf")
                         st.success("Email enviado (se credenciais estiverem corretas).")
                     except Exception as e:
                         st.error(f"Erro ao enviar email: {e}")
 
-        except Exception as e:
-            st.error(f"Erro ao processar o arquivo: {e}")
+                st.markdown("---")
+                st.subheader("Enviar demonstrativo individual a cada vendedor")
+                seller_emails = get_seller_emails(df_results['vendedor'])
+                com_email = [r for r in results if seller_emails.get(r['vendedor'])]
+                st.caption(f"{len(com_email)} de {len(results)} vendedores com e-mail cadastrado (usuário com o mesmo nome). Usa as configurações SMTP acima.")
+                if com_email and st.button("Enviar demonstrativos", key="btn_send_statements"):
+                    msgs = [emailer.build_message(sender, seller_emails[r['vendedor']], "Demonstrativo de Gratificação",
+                                          f"Olá, {r['vendedor']}. Segue em anexo o seu demonstrativo de gratificação.",
+                                          attachment=pdf, attachment_name=name)
+                            for name, pdf, r in pdfgen.generate_statements(com_email)]
+                    # one authenticated SMTP session per worker, reused for all messages
+                    with emailer.BulkMailer(smtp_host, smtp_port, smtp_user, smtp_pass) as mailer:
+                        status = mailer.send_all(msgs)
+                    enviados = sum(1 for s in status if s['ok'])
+                    (st.success if enviados == len(status) else st.warning)(f"{enviados} de {len(status)} demonstrativos enviados.")
+                    st.dataframe(pd.DataFrame(status)[['to', 'ok', 'attempts', 'error']])
+
+    except Exception as e:
+        st.error(f"Erro ao processar as vendas: {e}")
 
 # End of app.py
@@ -1,130 +1,429 @@
-
+import logging
+import os
+import queue
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-import bcrypt
+from calculo import normalizar_vendedor
+from instrumentacao import medido, rastrear_conexao
+from lazy import lazy_import
+
+# bcrypt só é carregado quando alguém faz login ou troca senha
+bcrypt = lazy_import("bcrypt")
+
+logger = logging.getLogger(__name__)
+
+# custo do bcrypt (log2 das iterações); hashes com outro custo são refeitos no próximo login
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+# hashes simultâneos: limita a CPU gasta quando muitos usuários entram ao mesmo tempo
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", "2"))
+
+DB_PATH = Path(os.environ.get("SYSTEM_DB_PATH") or Path(__file__).parent / "system.db")
+
+# Conexões SQLite de longa duração, compartilhadas entre sessões do Streamlit.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "4"))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHED_STATEMENTS = 128
 
-DB_PATH = Path(__file__).parent / "system.db"
+# Cache em memória das metas (nome normalizado -> dict), recarregado com uma
+# única consulta sempre que a versão muda. set_meta incrementa a versão.
+_metas_lock = threading.Lock()
+_metas_version = 0
+_metas_cache = None  # (versao, {vendedor: meta})
+# versão em que a meta de cada vendedor (nome normalizado) mudou pela última vez;
+# _metas_reset marca mudanças que podem ter afetado todos os vendedores
+_metas_changes = {}
+_metas_reset = 0
 
 def get_conn():
-    conn = sqlite3.connect(str(DB_PATH), check_same_thread=False)
+    """Abre uma conexão nova já configurada (WAL, busy timeout)."""
+    # cached_statements: como a conexão vive no pool, os statements preparados
+    # são reaproveitados entre chamadas em vez de recompilados a cada uso.
+    conn = sqlite3.connect(str(DB_PATH), check_same_thread=False,
+                           timeout=DB_BUSY_TIMEOUT_MS / 1000, cached_statements=DB_CACHED_STATEMENTS)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous=NORMAL")
     return conn
 
+class ConnectionPool:
+    """Pool simples de conexões para um arquivo SQLite."""
+
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return get_conn()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.path != DB_PATH:
+            # DB_PATH mudou (ex.: banco temporário): descarta o pool antigo
+            if _pool is not None:
+                _pool.close_all()
+            _pool = ConnectionPool(DB_PATH)
+        return _pool
+
+def close_pool():
+    """Fecha as conexões ociosas do pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
+
+@contextmanager
+def connection():
+    """Empresta uma conexão do pool; chamadas aninhadas na mesma thread reutilizam a mesma."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        yield conn
+        return
+    pool = _get_pool()
+    conn = pool.acquire()
+    rastrear_conexao(conn)
+    _local.conn = conn
+    try:
+        yield conn
+    finally:
+        _local.conn = None
+        pool.release(conn)
+
+@contextmanager
+def transaction():
+    """Agrupa escritas em um único commit (rollback em caso de erro).
+
+    Pode ser aninhado: só o bloco mais externo faz commit, então várias chamadas
+    como set_meta dentro de um `with transaction():` viram uma só transação.
+    """
+    with connection() as conn:
+        depth = getattr(_local, 'tx_depth', 0)
+        _local.tx_depth = depth + 1
+        try:
+            yield conn.cursor()
+        except BaseException:
+            if depth == 0:
+                conn.rollback()
+            raise
+        else:
+            if depth == 0:
+                conn.commit()
+        finally:
+            _local.tx_depth = depth
+
 def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        role TEXT NOT NULL,
-        fullname TEXT,
-        email TEXT
-    )''')
-    cur.execute('''
-    CREATE TABLE IF NOT EXISTS metas (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        vendedor TEXT NOT NULL,
-        meta_min REAL,
-        meta_100 REAL,
-        gratificacao_100 REAL,
-        bonus_pct REAL
-    )''')
-    conn.commit()
-    # default admin user
-    cur.execute("SELECT * FROM users WHERE username = ?", ('admin',))
-    if cur.fetchone() is None:
-        pw = 'admin'.encode('utf-8')
-        hashed = bcrypt.hashpw(pw, bcrypt.gensalt()).decode('utf-8')
-        cur.execute("INSERT INTO users (username, password_hash, role, fullname, email) VALUES (?,?,?,?,?)",
-                    ('admin', hashed, 'ADMIN', 'Administrador', 'admin@example.com'))
-        conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL,
+            fullname TEXT,
+            email TEXT
+        )''')
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS metas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            vendedor TEXT NOT NULL,
+            vendedor_chave TEXT,
+            meta_min REAL,
+            meta_100 REAL,
+            gratificacao_100 REAL,
+            bonus_pct REAL
+        )''')
+        # migração: as metas passam a ser únicas pelo nome normalizado (sem
+        # caixa, espaços ou acentos), o mesmo usado para casar com a planilha.
+        # Nomes diferentes com a mesma chave ("João" / "joao") eram metas
+        # distintas: a mais antiga fica em metas e as demais vão para
+        # metas_conflitos, para o admin decidir (nada é descartado).
+        if 'vendedor_chave' not in {r['name'] for r in cur.execute("PRAGMA table_info(metas)")}:
+            cur.execute("ALTER TABLE metas ADD COLUMN vendedor_chave TEXT")
+        sem_chave = cur.execute("SELECT id, vendedor FROM metas WHERE vendedor_chave IS NULL").fetchall()
+        cur.executemany("UPDATE metas SET vendedor_chave = ? WHERE id = ?",
+                        [(normalizar_vendedor(r['vendedor']), r['id']) for r in sem_chave])
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS metas_conflitos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            meta_id INTEGER NOT NULL,
+            mantida_id INTEGER NOT NULL,
+            vendedor TEXT NOT NULL,
+            vendedor_chave TEXT NOT NULL,
+            meta_min REAL,
+            meta_100 REAL,
+            gratificacao_100 REAL,
+            bonus_pct REAL,
+            registrado_em TEXT NOT NULL
+        )''')
+        cur.execute("""INSERT INTO metas_conflitos (meta_id, mantida_id, vendedor, vendedor_chave, meta_min, meta_100, gratificacao_100, bonus_pct, registrado_em)
+                       SELECT m.id, k.mantida_id, m.vendedor, m.vendedor_chave, m.meta_min, m.meta_100, m.gratificacao_100, m.bonus_pct, datetime('now')
+                       FROM metas m JOIN (SELECT vendedor_chave, MIN(id) AS mantida_id FROM metas GROUP BY vendedor_chave) k
+                         ON k.vendedor_chave = m.vendedor_chave AND m.id <> k.mantida_id""")
+        metas_removidas = cur.rowcount
+        if metas_removidas:
+            cur.execute("DELETE FROM metas WHERE id IN (SELECT meta_id FROM metas_conflitos)")
+            logger.warning("init_db: %d meta(s) com nome repetido (sem caixa/acentos) movidas para metas_conflitos: %s",
+                           metas_removidas, sorted({r['vendedor'] for r in cur.execute("SELECT vendedor FROM metas_conflitos")}))
+        cur.execute("DROP INDEX IF EXISTS idx_metas_vendedor")
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_metas_vendedor_chave ON metas (vendedor_chave)")
+        # histórico de cálculos: uma execução por período (AAAA-MM) e seus resultados por vendedor
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS calc_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            periodo TEXT NOT NULL,
+            criado_em TEXT NOT NULL,
+            criado_por TEXT,
+            arquivo TEXT,
+            arquivo_hash TEXT,
+            total REAL
+        )''')
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS calc_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER NOT NULL REFERENCES calc_runs (id),
+            periodo TEXT NOT NULL,
+            vendedor TEXT NOT NULL,
+            vendedor_chave TEXT NOT NULL,
+            vendas REAL,
+            meta_100 REAL,
+            atingimento REAL,
+            grat_base REAL,
+            bonus REAL,
+            total REAL,
+            linhas INTEGER
+        )''')
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_calc_runs_periodo ON calc_runs (periodo)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_calc_results_run ON calc_results (run_id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_calc_results_periodo ON calc_results (periodo)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_calc_results_vendedor ON calc_results (vendedor_chave, periodo)")
+        # default admin user
+        cur.execute("SELECT * FROM users WHERE username = ?", ('admin',))
+        if cur.fetchone() is None:
+            pw = 'admin'.encode('utf-8')
+            hashed = _hashpw(pw)
+            cur.execute("INSERT INTO users (username, password_hash, role, fullname, email) VALUES (?,?,?,?,?)",
+                        ('admin', hashed, 'ADMIN', 'Administrador', 'admin@example.com'))
+    if metas_removidas:
+        invalidate_metas_cache()
+
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+def _get_hash_pool():
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ThreadPoolExecutor(max_workers=max(1, HASH_WORKERS), thread_name_prefix='bcrypt')
+        return _hash_pool
+
+def _hashpw(pw):
+    return bcrypt.hashpw(pw, bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+def _checkpw(pw, stored):
+    try:
+        return bcrypt.checkpw(pw, stored)
+    except Exception:
+        return False
+
+@medido()
+def hash_password(password):
+    """Hash bcrypt com o custo BCRYPT_ROUNDS, calculado no pool limitado de hashing."""
+    return _get_hash_pool().submit(_hashpw, password.encode('utf-8')).result()
+
+@medido()
+def check_password(password, stored_hash):
+    return _get_hash_pool().submit(_checkpw, password.encode('utf-8'), stored_hash.encode('utf-8')).result()
+
+def needs_rehash(stored_hash):
+    """True se o hash foi gerado com um custo diferente de BCRYPT_ROUNDS ($2b$<custo>$...)."""
+    try:
+        return int(stored_hash.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
 
 def create_user(username, password, role='USER', fullname=None, email=None):
-    conn = get_conn()
-    cur = conn.cursor()
-    pw = password.encode('utf-8')
-    hashed = bcrypt.hashpw(pw, bcrypt.gensalt()).decode('utf-8')
+    hashed = hash_password(password)
     try:
-        cur.execute("INSERT INTO users (username, password_hash, role, fullname, email) VALUES (?,?,?,?,?)",
-                    (username, hashed, role.upper(), fullname, email))
-        conn.commit()
+        with transaction() as cur:
+            cur.execute("INSERT INTO users (username, password_hash, role, fullname, email) VALUES (?,?,?,?,?)",
+                        (username, hashed, role.upper(), fullname, email))
         return True, None
     except Exception as e:
         return False, str(e)
-    finally:
-        conn.close()
 
+def _user_dict(row):
+    return {'id': row['id'], 'username': row['username'], 'role': row['role'], 'fullname': row['fullname'], 'email': row['email']}
+
+@medido()
 def authenticate(username, password):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM users WHERE username = ?", (username,))
-    row = cur.fetchone()
-    conn.close()
+    with connection() as conn:
+        row = conn.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
     if row is None:
         return False, None
-    stored = row['password_hash'].encode('utf-8')
-    try:
-        ok = bcrypt.checkpw(password.encode('utf-8'), stored)
-    except Exception:
-        ok = False
-    if ok:
-        return True, {'id': row['id'], 'username': row['username'], 'role': row['role'], 'fullname': row['fullname'], 'email': row['email']}
-    return False, None
+    if not check_password(password, row['password_hash']):
+        return False, None
+    if needs_rehash(row['password_hash']):
+        # custo mudou: regrava o hash com a senha que acabou de ser conferida
+        with transaction() as cur:
+            cur.execute("UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?",
+                        (hash_password(password), row['id'], row['password_hash']))
+    return True, _user_dict(row)
 
 def list_users():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, username, role, fullname, email FROM users ORDER BY id")
-    rows = cur.fetchall()
-    conn.close()
+    with connection() as conn:
+        rows = conn.execute("SELECT id, username, role, fullname, email FROM users ORDER BY id").fetchall()
     return [dict(r) for r in rows]
 
 def delete_user(username):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM users WHERE username = ?", (username,))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute("DELETE FROM users WHERE username = ?", (username,))
 
 def change_password(username, new_password):
-    conn = get_conn()
-    cur = conn.cursor()
-    hashed = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-    cur.execute("UPDATE users SET password_hash = ? WHERE username = ?", (hashed, username))
-    conn.commit()
-    conn.close()
+    hashed = hash_password(new_password)
+    with transaction() as cur:
+        cur.execute("UPDATE users SET password_hash = ? WHERE username = ?", (hashed, username))
 
+@medido()
 def set_meta(vendedor, meta_min=None, meta_100=None, grat_100=None, bonus_pct=None):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id FROM metas WHERE vendedor = ?", (vendedor,))
-    r = cur.fetchone()
-    if r:
-        cur.execute("UPDATE metas SET meta_min = COALESCE(?,meta_min), meta_100 = COALESCE(?,meta_100), gratificacao_100 = COALESCE(?,gratificacao_100), bonus_pct = COALESCE(?,bonus_pct) WHERE vendedor = ?",
-                    (meta_min, meta_100, grat_100, bonus_pct, vendedor))
-    else:
-        cur.execute("INSERT INTO metas (vendedor, meta_min, meta_100, gratificacao_100, bonus_pct) VALUES (?,?,?,?,?)",
-                    (vendedor, meta_min, meta_100, grat_100, bonus_pct))
-    conn.commit()
-    conn.close()
+    """Grava a meta do vendedor; nomes que só diferem em caixa/acentos/espaços são o mesmo vendedor.
+
+    Campos None mantêm o valor já salvo.
+    """
+    with transaction() as cur:
+        cur.execute("""INSERT INTO metas (vendedor, vendedor_chave, meta_min, meta_100, gratificacao_100, bonus_pct) VALUES (?,?,?,?,?,?)
+                       ON CONFLICT(vendedor_chave) DO UPDATE SET meta_min = COALESCE(excluded.meta_min,meta_min), meta_100 = COALESCE(excluded.meta_100,meta_100),
+                       gratificacao_100 = COALESCE(excluded.gratificacao_100,gratificacao_100), bonus_pct = COALESCE(excluded.bonus_pct,bonus_pct)""",
+                    (vendedor, normalizar_vendedor(vendedor), meta_min, meta_100, grat_100, bonus_pct))
+    invalidate_metas_cache(vendedor)
 
+def list_metas_conflitos():
+    """Metas que a migração não pôde manter (mesmo nome normalizado de outra), com a meta mantida."""
+    with connection() as conn:
+        rows = conn.execute("""SELECT c.id, c.vendedor, c.meta_min, c.meta_100, c.gratificacao_100, c.bonus_pct,
+                                      m.vendedor AS mantida_vendedor, m.meta_min AS mantida_meta_min, m.meta_100 AS mantida_meta_100,
+                                      m.gratificacao_100 AS mantida_gratificacao_100, m.bonus_pct AS mantida_bonus_pct, c.registrado_em
+                               FROM metas_conflitos c LEFT JOIN metas m ON m.vendedor_chave = c.vendedor_chave
+                               ORDER BY c.vendedor_chave, c.id""").fetchall()
+    return [dict(r) for r in rows]
+
+def resolver_meta_conflito(conflito_id, aplicar):
+    """Resolve um conflito: com `aplicar`, os valores dele substituem a meta mantida; senão é descartado."""
+    with transaction() as cur:
+        r = cur.execute("SELECT * FROM metas_conflitos WHERE id = ?", (conflito_id,)).fetchone()
+        if r is None:
+            return False
+        if aplicar:
+            cur.execute("""UPDATE metas SET meta_min = ?, meta_100 = ?, gratificacao_100 = ?, bonus_pct = ? WHERE vendedor_chave = ?""",
+                        (r['meta_min'], r['meta_100'], r['gratificacao_100'], r['bonus_pct'], r['vendedor_chave']))
+        cur.execute("DELETE FROM metas_conflitos WHERE id = ?", (conflito_id,))
+    if aplicar:
+        invalidate_metas_cache(r['vendedor'])
+    return True
+
+@medido()
 def get_meta(vendedor):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM metas WHERE vendedor = ?", (vendedor,))
-    r = cur.fetchone()
-    conn.close()
+    with connection() as conn:
+        r = conn.execute("SELECT * FROM metas WHERE vendedor_chave = ?", (normalizar_vendedor(vendedor),)).fetchone()
     if r:
         return dict(r)
     return None
 
+@medido()
 def list_metas():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM metas ORDER BY vendedor")
-    rows = cur.fetchall()
-    conn.close()
+    with connection() as conn:
+        rows = conn.execute("SELECT * FROM metas ORDER BY vendedor").fetchall()
     return [dict(r) for r in rows]
+
+def metas_version():
+    """Versão atual das metas; muda a cada set_meta."""
+    return _metas_version
+
+def invalidate_metas_cache(vendedor=None):
+    """Nova versão das metas; sem `vendedor`, considera que todas mudaram."""
+    global _metas_version, _metas_cache, _metas_reset
+    with _metas_lock:
+        _metas_version += 1
+        _metas_cache = None
+        if vendedor is None:
+            _metas_reset = _metas_version
+        else:
+            _metas_changes[normalizar_vendedor(vendedor)] = _metas_version
+
+def metas_changes_since(version):
+    """Vendedores (nome normalizado) cujas metas mudaram depois de `version`: {chave: versão}.
+
+    Devolve None se houve uma mudança geral, ou seja, se tudo deve ser recalculado.
+    """
+    with _metas_lock:
+        if _metas_reset > version:
+            return None
+        return {k: v for k, v in _metas_changes.items() if v > version}
+
+def _metas_snapshot():
+    global _metas_cache
+    with _metas_lock:
+        cached = _metas_cache
+        version = _metas_version
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    snapshot = {}
+    with connection() as conn:
+        for r in conn.execute("SELECT * FROM metas"):
+            snapshot[r['vendedor_chave']] = dict(r)
+    with _metas_lock:
+        if _metas_version == version:
+            _metas_cache = (version, snapshot)
+    return snapshot
+
+@medido()
+def get_metas(vendedores):
+    """Metas de vários vendedores de uma vez: {vendedor: meta ou None}.
+
+    A comparação de nomes ignora caixa, espaços e acentos. Usa o cache em
+    memória; o banco só é consultado quando as metas mudaram.
+    """
+    snapshot = _metas_snapshot()
+    return {v: snapshot.get(normalizar_vendedor(v)) for v in vendedores}
+
+@medido()
+def get_seller_emails(vendedores):
+    """E-mail de cada vendedor: {vendedor: email ou None}.
+
+    O vendedor é associado ao usuário com o mesmo nome completo ou nome de
+    usuário (mesma normalização das metas).
+    """
+    index = {}
+    with connection() as conn:
+        rows = conn.execute("SELECT username, fullname, email FROM users WHERE email IS NOT NULL AND email <> '' ORDER BY id").fetchall()
+    for r in rows:
+        for nome in (r['fullname'], r['username']):
+            if nome:
+                index.setdefault(normalizar_vendedor(nome), r['email'])
+    return {v: index.get(normalizar_vendedor(v)) for v in vendedores}
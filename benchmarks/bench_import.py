@@ -0,0 +1,54 @@
+"""Benchmark do tempo de import na partida do app.
+
+Mede, em processos novos, o import dos módulos que o app.py carrega no topo
+(sem o Streamlit) e confere que os pesados ficam para depois: reportlab,
+smtplib, openpyxl e bcrypt não podem estar carregados ao fim da partida.
+
+Uso: python benchmarks/bench_import.py [--repeat 5] [--max-ms 1500]
+Imprime um JSON; sai com código 1 se algum módulo pesado foi carregado ou se a
+mediana passar de --max-ms (0 desliga o limite).
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY = ['reportlab', 'smtplib', 'openpyxl', 'bcrypt']
+
+# o mesmo que app.py faz no topo, exceto o Streamlit
+STARTUP = '''
+import time, sys, json
+t0 = time.perf_counter()
+import pandas as pd
+import auth, cache
+from lazy import lazy_import
+for name in ("ingestao", "pipeline", "pdfgen", "emailer", "historico", "powerbi"):
+    lazy_import(name)
+elapsed = time.perf_counter() - t0
+loaded = [m for m in %r if m in sys.modules]
+print(json.dumps({"ms": elapsed * 1000, "loaded": loaded}))
+''' % (HEAVY,)
+
+def run_once(code):
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--repeat', type=int, default=5)
+    ap.add_argument('--max-ms', type=float, default=1500.0, help="limite da mediana em ms (0 desliga)")
+    args = ap.parse_args(argv)
+    runs = [run_once(STARTUP) for _ in range(args.repeat)]
+    times = [r['ms'] for r in runs]
+    loaded = sorted({m for r in runs for m in r['loaded']})
+    result = {'startup_ms_median': round(statistics.median(times), 1), 'startup_ms_min': round(min(times), 1),
+              'heavy_modules_loaded': loaded, 'repeat': args.repeat}
+    print(json.dumps(result, indent=2))
+    too_slow = bool(args.max_ms) and result['startup_ms_median'] > args.max_ms
+    return 1 if loaded or too_slow else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""Benchmark do pdfgen: modo tabela (platypus) x modo canvas.
+
+Uso: python benchmarks/bench_pdf.py [--rows 500 5000 20000]
+Imprime um JSON com linhas/segundo de cada modo.
+"""
+import argparse
+import io
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pdfgen import generate_pdf_report  # noqa: E402
+
+def synthetic_rows(n, seed=0):
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(n):
+        vendas = round(rnd.uniform(0, 50000), 2)
+        meta = float(rnd.choice([10000, 20000, 30000]))
+        ating = round(vendas / meta, 4)
+        base = round(min(ating, 1.0) * 500, 2)
+        bonus = round(max(vendas - meta, 0) * 0.1, 2)
+        rows.append({'vendedor': f'Vendedor {i:06d}', 'vendas': vendas, 'meta_100': meta, 'atingimento': ating,
+                     'grat_base': base, 'bonus': bonus, 'total': round(base + bonus, 2)})
+    return rows
+
+def bench(rows, fast):
+    buf = io.BytesIO()
+    t0 = time.perf_counter()
+    generate_pdf_report(buf, "Benchmark", rows, totals=123.45, footer_text="bench", fast=fast)
+    elapsed = time.perf_counter() - t0
+    return {'seconds': round(elapsed, 4), 'rows_per_sec': round(len(rows) / elapsed, 1), 'bytes': len(buf.getvalue())}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--rows', type=int, nargs='+', default=[500, 5000, 20000])
+    args = ap.parse_args(argv)
+    out = []
+    for n in args.rows:
+        rows = synthetic_rows(n)
+        out.append({'rows': n, 'table': bench(rows, fast=False), 'canvas': bench(rows, fast=True)})
+    print(json.dumps(out, indent=2))
+
+if __name__ == '__main__':
+    main()
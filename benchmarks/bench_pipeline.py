@@ -0,0 +1,165 @@
+"""Benchmark do fluxo upload → cálculo → relatório, etapa por etapa.
+
+Gera uma planilha sintética (linhas, vendedores e fração de valores em texto
+"R$ 1.234,56" configuráveis) e metas sintéticas num system.db temporário, e
+mede separadamente: leitura do Excel, conversão dos valores, busca de metas
+(get_meta por linha x get_metas em lote), cálculo (calcular_gratificacao por
+vendedor x calcular_gratificacao_lote), generate_pdf_report e montagem dos
+e-mails (build_message).
+
+Uso: python benchmarks/bench_pipeline.py [--rows 100000] [--sellers 200] [--text-ratio 0.5] [--out resultado.json]
+Imprime um JSON com segundos, linhas/segundo e pico de memória de cada etapa,
+para comparar versões. O pico da etapa vem do tracemalloc (alocações Python e
+numpy feitas durante a etapa, acima do que já estava alocado), numa segunda
+execução da etapa para não distorcer o tempo; o pico de RSS do processo
+inteiro sai à parte, em process_peak_rss_mb.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+# o auth lê SYSTEM_DB_PATH no import: o system.db do repositório nunca é tocado
+TMP = Path(tempfile.mkdtemp(prefix='bench_pipeline_'))
+os.environ['SYSTEM_DB_PATH'] = str(TMP / 'system.db')
+
+import pandas as pd  # noqa: E402
+from openpyxl import Workbook  # noqa: E402
+import auth  # noqa: E402
+from calculo import calcular_gratificacao, calcular_gratificacao_lote, normalizar_vendedor  # noqa: E402
+from emailer import build_message  # noqa: E402
+from ingestao import LeituraPlanilha, converter_valores, pico_memoria_mb  # noqa: E402
+from pdfgen import generate_pdf_report  # noqa: E402
+from pipeline import calcular_resultados, resultados_para_linhas  # noqa: E402
+
+def _moeda_texto(valor):
+    # formato brasileiro: R$ 1.234,56
+    inteiro, dec = f"{valor:,.2f}".split('.')
+    return f"R$ {inteiro.replace(',', '.')},{dec}"
+
+def gerar_planilha(path, rows, sellers, text_ratio, seed=0):
+    """Planilha .xlsx com as colunas VENDEDOR e VALOR DE VENDA."""
+    rnd = random.Random(seed)
+    nomes = [f"Vendedor {i:04d}" for i in range(sellers)]
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Vendas')
+    ws.append(['VENDEDOR', 'VALOR DE VENDA'])
+    for _ in range(rows):
+        valor = round(rnd.uniform(10, 5000), 2)
+        ws.append([rnd.choice(nomes), _moeda_texto(valor) if rnd.random() < text_ratio else valor])
+    wb.save(path)
+    return nomes
+
+def gerar_metas(nomes, seed=0):
+    rnd = random.Random(seed)
+    with auth.transaction() as cur:
+        cur.executemany("INSERT INTO metas (vendedor, vendedor_chave, meta_min, meta_100, gratificacao_100, bonus_pct) VALUES (?,?,?,?,?,?)",
+                        [(n, normalizar_vendedor(n), 20000.0, float(rnd.choice([30000, 40000, 50000])), 500.0, 0.02) for n in nomes])
+    auth.invalidate_metas_cache()
+
+def medir(nome, n, func, preparar=None):
+    """Tempo da etapa (sem tracemalloc) e, numa segunda execução, o pico de memória dela."""
+    if preparar:
+        preparar()
+    t0 = time.perf_counter()
+    valor = func()
+    elapsed = time.perf_counter() - t0
+    if preparar:
+        preparar()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        func()
+        pico = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return valor, {'stage': nome, 'items': n, 'seconds': round(elapsed, 4),
+                   'per_sec': round(n / elapsed, 1) if elapsed else None,
+                   'peak_mb': round(pico / (1024 * 1024), 2)}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--rows', type=int, default=100_000)
+    ap.add_argument('--sellers', type=int, default=200)
+    ap.add_argument('--text-ratio', type=float, default=0.5, help="fração dos valores gravados como texto 'R$ 1.234,56'")
+    ap.add_argument('--per-row-limit', type=int, default=20_000, help="linhas medidas no get_meta por linha (é lento)")
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--out', default=None, help="grava o JSON também neste arquivo")
+    args = ap.parse_args(argv)
+
+    try:
+        auth.init_db()
+        planilha = TMP / 'vendas.xlsx'
+        t0 = time.perf_counter()
+        nomes = gerar_planilha(planilha, args.rows, args.sellers, args.text_ratio, args.seed)
+        gerar_metas(nomes, args.seed)
+        setup = round(time.perf_counter() - t0, 3)
+
+        etapas = []
+        def etapa(nome, n, func, preparar=None):
+            valor, medida = medir(nome, n, func, preparar)
+            etapas.append(medida)
+            return valor
+
+        def ler():
+            with LeituraPlanilha(str(planilha)) as leitura:
+                return pd.concat(list(leitura.blocos()), ignore_index=True)
+        brutos = etapa('excel_parse', args.rows, ler)
+        etapa('currency_normalize', args.rows, lambda: converter_valores(brutos['valor']))
+
+        amostra = brutos['vendedor'].head(args.per_row_limit).tolist()
+        etapa('meta_lookup_per_row', len(amostra), lambda: [auth.get_meta(v) for v in amostra])
+        # cache vazio a cada execução: mede a consulta, não o dict em memória
+        etapa('meta_lookup_bulk', args.rows, lambda: auth.get_metas(brutos['vendedor'].unique()),
+              preparar=auth.invalidate_metas_cache)
+
+        resultado = calcular_resultados([brutos])
+        agregado = resultado.agregado
+        metas = auth.get_metas(agregado['vendedor'].unique())
+        entradas = [(v, metas[n] or {}) for v, n in zip(agregado['vendas'], agregado['vendedor'])]
+        etapa('calculo_scalar', len(entradas), lambda: [
+            calcular_gratificacao(v, m.get('meta_min'), m.get('meta_100'), m.get('gratificacao_100'), m.get('bonus_pct'))
+            for v, m in entradas])
+        colunas = {c: [m.get(c) for _, m in entradas] for c in ('meta_min', 'meta_100', 'gratificacao_100', 'bonus_pct')}
+        etapa('calculo_lote', len(entradas), lambda: calcular_gratificacao_lote(
+            agregado['vendas'], colunas['meta_min'], colunas['meta_100'], colunas['gratificacao_100'], colunas['bonus_pct']))
+        etapa('pipeline_total', args.rows, lambda: calcular_resultados([brutos]))
+
+        linhas = resultados_para_linhas(resultado.resultados)
+        total = round(float(resultado.resultados['total'].sum()), 2)
+        pdf = etapa('pdf_report', len(linhas), lambda: generate_pdf_report(
+            None, "Benchmark", linhas, totals=total, footer_text="bench"))
+        # as_bytes força a serialização MIME completa, como no envio
+        etapa('email_build', len(linhas), lambda: [
+            build_message('bench@example.com', f"v{i}@example.com", "Demonstrativo", "bench",
+                          attachment=pdf, attachment_name='relatorio.pdf').as_bytes()
+            for i in range(len(linhas))])
+
+        pico_rss = pico_memoria_mb()
+        relatorio = {
+            'params': {'rows': args.rows, 'sellers': args.sellers, 'text_ratio': args.text_ratio, 'seed': args.seed},
+            'python': platform.python_version(),
+            'setup_seconds': setup,
+            'pdf_bytes': len(pdf),
+            'stages': etapas,
+            'process_peak_rss_mb': round(pico_rss, 1) if pico_rss is not None else None,
+        }
+    finally:
+        auth.close_pool()
+        shutil.rmtree(TMP, ignore_errors=True)
+    texto = json.dumps(relatorio, indent=2)
+    print(texto)
+    if args.out:
+        Path(args.out).write_text(texto + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""Benchmark dos demonstrativos por vendedor em paralelo.
+
+Uso: python benchmarks/bench_statements.py [--sellers 2000] [--workers 1 2 4]
+Imprime um JSON com PDFs/segundo para cada número de processos.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pdfgen import generate_statements_zip  # noqa: E402
+from bench_pdf import synthetic_rows  # noqa: E402
+
+def main(argv=None):
+    cpus = os.cpu_count() or 1
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--sellers', type=int, default=2000)
+    ap.add_argument('--workers', type=int, nargs='+', default=sorted({1, 2, cpus}))
+    ap.add_argument('--chunk-size', type=int, default=None)
+    args = ap.parse_args(argv)
+    rows = synthetic_rows(args.sellers)
+    out = []
+    for w in args.workers:
+        t0 = time.perf_counter()
+        data = generate_statements_zip(None, rows, workers=w, chunk_size=args.chunk_size)
+        elapsed = time.perf_counter() - t0
+        out.append({'workers': w, 'sellers': len(rows), 'seconds': round(elapsed, 3),
+                    'pdfs_per_sec': round(len(rows) / elapsed, 1), 'zip_bytes': len(data)})
+    print(json.dumps({'cpus': cpus, 'results': out}, indent=2))
+
+if __name__ == '__main__':
+    main()
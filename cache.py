@@ -0,0 +1,92 @@
+"""Cache em memória dos uploads já processados.
+
+A chave é o hash do conteúdo do arquivo (mais o que mais influir no resultado,
+como a aba e a versão das metas), de modo que os reruns do Streamlit não
+reprocessam a mesma planilha. O cache é limitado por tamanho e descarta as
+entradas menos usadas.
+"""
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+CACHE_MAX_MB = float(os.environ.get("CACHE_MAX_MB", "256"))
+
+def hash_conteudo(source, bufsize=1024 * 1024):
+    """SHA-256 do conteúdo de um arquivo (caminho, bytes ou file-like)."""
+    h = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        h.update(source)
+    elif hasattr(source, 'getbuffer'):
+        h.update(source.getbuffer())
+    elif hasattr(source, 'read'):
+        source.seek(0)
+        for chunk in iter(lambda: source.read(bufsize), b''):
+            h.update(chunk)
+        source.seek(0)
+    else:
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(bufsize), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+def tamanho_bytes(valor):
+    """Estimativa do tamanho em memória de um valor (DataFrames contados em profundidade)."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(deep=True))
+    if isinstance(valor, dict):
+        return sum(tamanho_bytes(v) for v in valor.values())
+    if isinstance(valor, (list, tuple)):
+        return sum(tamanho_bytes(v) for v in valor)
+    return sys.getsizeof(valor)
+
+class LRUCache:
+    """Cache LRU limitado pelo tamanho total (bytes) das entradas."""
+
+    def __init__(self, max_bytes=int(CACHE_MAX_MB * 1024 * 1024)):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._data = OrderedDict()  # chave -> (valor, tamanho)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            self._data.move_to_end(key)
+            return item[0]
+
+    def put(self, key, value):
+        size = tamanho_bytes(value)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            if size > self.max_bytes:
+                # maior que o cache inteiro: não guarda
+                return value
+            self._data[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.total_bytes -= evicted
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+# cache compartilhado pelas sessões do app
+RESULTADOS = LRUCache()
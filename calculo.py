@@ -1,3 +1,7 @@
+import unicodedata
+import numpy as np
+import pandas as pd
+from instrumentacao import medido
 
 def calcular_gratificacao(vendas, meta_min, meta_100, grat_100, bonus_pct):
     # Inputs: numeric values (floats). If meta values missing, return zeros.
@@ -18,3 +22,76 @@ def calcular_gratificacao(vendas, meta_min, meta_100, grat_100, bonus_pct):
         bonus = (vendas - meta_100) * bonus_pct
     total = round(grat_base + bonus,2)
     return {'atingimento': round(atingimento,4), 'grat_base': round(grat_base,2), 'bonus': round(bonus,2), 'total': total}
+
+def arredondar(valores, casas):
+    """round() vetorizado com o mesmo resultado do round() do Python."""
+    # np.round(x*10**n)/10**n pode divergir do round() do Python em valores muito
+    # próximos de ...5; esses poucos casos são refeitos com round() para manter
+    # o mesmo resultado da versão escalar.
+    valores = np.asarray(valores, dtype=float)
+    out = np.round(valores, casas)
+    escalado = valores * 10.0 ** casas
+    dist = np.abs(escalado - np.floor(escalado) - 0.5)
+    ambiguos = np.flatnonzero(np.isfinite(valores) & (dist <= 1e-9 * np.maximum(1.0, np.abs(escalado))))
+    for i in ambiguos:
+        out[i] = round(float(valores[i]), casas)
+    return out
+
+def _como_float(valores, n=None):
+    # None/NaN -> NaN; escalares são replicados para o tamanho do lote
+    if valores is None or np.isscalar(valores):
+        valores = [valores] * n
+    arr = np.asarray(valores)
+    if arr.dtype.kind in 'biuf':
+        return arr.astype(float)
+    return pd.to_numeric(pd.Series(arr, dtype=object), errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+@medido()
+def calcular_gratificacao_lote(vendas, meta_min, meta_100, grat_100, bonus_pct):
+    """Versão vetorizada de calcular_gratificacao.
+
+    Recebe arrays alinhados (ou escalares) e devolve um DataFrame com as colunas
+    atingimento, grat_base, bonus e total, linha a linha idêntico à função
+    escalar. Valores ausentes (None/NaN) seguem as mesmas regras; atingimento
+    ausente fica como NaN.
+    """
+    vendas = _como_float(vendas)
+    n = len(vendas)
+    meta_min = _como_float(meta_min, n)
+    meta_100 = _como_float(meta_100, n)
+    grat_100 = _como_float(grat_100, n)
+    bonus_pct = _como_float(bonus_pct, n)
+
+    validos = ~(np.isnan(vendas) | np.isnan(meta_100) | np.isnan(grat_100))
+    calcula = validos & (meta_100 != 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        atingimento = np.where(calcula, vendas / meta_100, np.nan)
+    # abaixo da meta mínima não há gratificação (meta_min ausente não bloqueia)
+    paga = calcula & ~(vendas < meta_min)
+
+    grat_base = np.where(paga, np.minimum(atingimento, 1.0) * grat_100, 0.0)
+    tem_bonus = paga & (vendas > meta_100) & ~np.isnan(bonus_pct)
+    bonus = np.where(tem_bonus, (vendas - meta_100) * bonus_pct, 0.0)
+    total = grat_base + bonus
+
+    atingimento = np.where(validos & (meta_100 == 0), 0.0, arredondar(atingimento, 4))
+    return pd.DataFrame({
+        'atingimento': atingimento,
+        'grat_base': arredondar(grat_base, 2),
+        'bonus': arredondar(bonus, 2),
+        'total': arredondar(total, 2),
+    })
+
+def normalizar_vendedor(nome):
+    """Chave de comparação de nomes de vendedor: ignora caixa, espaços extras e acentos."""
+    if nome is None:
+        return ''
+    s = unicodedata.normalize('NFKD', str(nome))
+    s = ''.join(c for c in s if not unicodedata.combining(c))
+    return ' '.join(s.casefold().split())
+
+def normalizar_vendedores(nomes):
+    """normalizar_vendedor aplicado a uma Series (calculado uma vez por nome distinto)."""
+    nomes = pd.Series(nomes)
+    chaves = {n: normalizar_vendedor(n) for n in nomes.unique()}
+    return nomes.map(chaves)
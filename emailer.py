@@ -1,8 +1,18 @@
-
+import os
 import smtplib, ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from email.message import EmailMessage
+from instrumentacao import medido
+
+# padrões do envio em lote (podem ser definidos nas variáveis de ambiente do deploy)
+SMTP_CONNECTIONS = int(os.environ.get("SMTP_CONNECTIONS", "2"))
+SMTP_RATE_PER_SEC = float(os.environ.get("SMTP_RATE_PER_SEC", "5"))
 
-def send_email(smtp_host, smtp_port, smtp_user, smtp_pass, sender, recipients, subject, body, attachment_path=None):
+@medido()
+def build_message(sender, recipients, subject, body, attachment_path=None, attachment=None, attachment_name='relatorio.pdf'):
+    """Monta o EmailMessage (sem enviar). Anexo como em send_email."""
     msg = EmailMessage()
     msg['Subject'] = subject
     msg['From'] = sender
@@ -12,9 +22,161 @@ def send_email(smtp_host, smtp_port, smtp_user, smtp_pass, sender, recipients, s
         with open(attachment_path,'rb') as f:
             data = f.read()
         msg.add_attachment(data, maintype='application', subtype='pdf', filename=attachment_path.split('/')[-1])
-    context = ssl.create_default_context()
-    with smtplib.SMTP(smtp_host, int(smtp_port)) as server:
-        server.starttls(context=context)
-        server.login(smtp_user, smtp_pass)
+    if attachment is not None:
+        data = attachment.getvalue() if hasattr(attachment, 'getvalue') else bytes(attachment)
+        msg.add_attachment(data, maintype='application', subtype='pdf', filename=attachment_name)
+    return msg
+
+@medido()
+def connect(smtp_host, smtp_port, smtp_user, smtp_pass, starttls=True, timeout=30):
+    """Abre uma sessão SMTP (STARTTLS e login quando configurados)."""
+    server = smtplib.SMTP(smtp_host, int(smtp_port), timeout=timeout)
+    try:
+        if starttls:
+            server.starttls(context=ssl.create_default_context())
+        if smtp_user:
+            server.login(smtp_user, smtp_pass)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+@medido()
+def send_email(smtp_host, smtp_port, smtp_user, smtp_pass, sender, recipients, subject, body, attachment_path=None, attachment=None, attachment_name='relatorio.pdf'):
+    """Envia um email, opcionalmente com um PDF anexo.
+
+    O anexo pode vir de um arquivo (`attachment_path`) ou direto da memória
+    (`attachment`: bytes ou BytesIO, com nome `attachment_name`).
+    """
+    msg = build_message(sender, recipients, subject, body, attachment_path, attachment, attachment_name)
+    with connect(smtp_host, smtp_port, smtp_user, smtp_pass) as server:
         server.send_message(msg)
     return True
+
+class _RateLimiter:
+    """Espaça os envios de todas as conexões para no máximo `per_second` por segundo."""
+
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def _is_connection_error(exc):
+    # SMTPException herda de OSError; aqui só interessam queda de sessão e rede
+    return isinstance(exc, smtplib.SMTPServerDisconnected) or (
+        isinstance(exc, OSError) and not isinstance(exc, smtplib.SMTPException))
+
+def _is_transient(exc):
+    # queda de conexão / rede ou resposta 4xx do servidor: vale tentar de novo
+    if _is_connection_error(exc) or isinstance(exc, smtplib.SMTPConnectError):
+        return True
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    return False
+
+class BulkMailer:
+    """Envio em lote reaproveitando sessões SMTP autenticadas.
+
+    Cada thread do pool (`connections`) mantém uma sessão aberta e a reutiliza
+    para várias mensagens; em falha transitória a sessão é reaberta e o envio
+    repetido com backoff exponencial. `rate_per_sec` limita a taxa total.
+
+        with BulkMailer(host, port, user, pwd, connections=2) as mailer:
+            status = mailer.send_all(mensagens)
+    """
+
+    def __init__(self, smtp_host, smtp_port, smtp_user, smtp_pass, connections=SMTP_CONNECTIONS, rate_per_sec=SMTP_RATE_PER_SEC,
+                 max_retries=3, backoff=1.0, starttls=True, timeout=30):
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        self.smtp_user = smtp_user
+        self.smtp_pass = smtp_pass
+        self.connections = max(1, int(connections))
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.starttls = starttls
+        self.timeout = timeout
+        self._limiter = _RateLimiter(rate_per_sec)
+        self._local = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+        # pool persistente: as threads (e suas sessões) sobrevivem entre send_all
+        self._pool = ThreadPoolExecutor(max_workers=self.connections, thread_name_prefix='smtp')
+
+    def _session(self):
+        server = getattr(self._local, 'server', None)
+        if server is None:
+            server = connect(self.smtp_host, self.smtp_port, self.smtp_user, self.smtp_pass,
+                             starttls=self.starttls, timeout=self.timeout)
+            self._local.server = server
+            with self._sessions_lock:
+                self._sessions.append(server)
+        return server
+
+    def _drop_session(self):
+        server = getattr(self._local, 'server', None)
+        self._local.server = None
+        if server is not None:
+            with self._sessions_lock:
+                if server in self._sessions:
+                    self._sessions.remove(server)
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    @medido()
+    def send(self, msg):
+        """Envia uma mensagem com retry. Devolve o status do destinatário (dict)."""
+        status = {'to': msg['To'], 'subject': msg['Subject'], 'ok': False, 'attempts': 0, 'refused': None, 'error': None}
+        for attempt in range(1, self.max_retries + 2):
+            status['attempts'] = attempt
+            self._limiter.wait()
+            try:
+                refused = self._session().send_message(msg)
+                status['ok'] = True
+                status['refused'] = refused or None
+                status['error'] = None
+                return status
+            except Exception as e:
+                status['error'] = f"{type(e).__name__}: {e}"
+                if _is_connection_error(e):
+                    # sessão perdida: a próxima tentativa reconecta
+                    self._drop_session()
+                if not _is_transient(e) or attempt > self.max_retries:
+                    return status
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+        return status
+
+    @medido()
+    def send_all(self, messages):
+        """Envia várias mensagens pelo pool; devolve os status na mesma ordem."""
+        return list(self._pool.map(self.send, messages))
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, []
+        for server in sessions:
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,177 @@
+"""Execução sem interface (cron / GitHub Actions) do cálculo de gratificações.
+
+    python -m gratificacoes run --input vendas.xlsx --out relatorio.pdf --email
+    python -m gratificacoes run --input pasta_com_planilhas/ --out relatorios/
+    python -m gratificacoes run --powerbi-dataset <id> --powerbi-order-col Id --out relatorio.pdf
+
+Reaproveita ingestao/pipeline, pdfgen e emailer, sem importar o Streamlit.
+As configurações de SMTP vêm das mesmas variáveis de ambiente do app
+(SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, EMAIL_FROM, RECIPIENTS); as do
+Power BI, de POWERBI_TENANT_ID, POWERBI_CLIENT_ID e POWERBI_CLIENT_SECRET.
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+from auth import init_db, get_seller_emails
+from pipeline import processar_planilha, processar_powerbi, resultados_para_linhas
+from pdfgen import generate_pdf_report, generate_statements, generate_statements_zip
+from emailer import send_email, build_message, BulkMailer
+import instrumentacao
+
+EXTENSOES = ('.xlsx', '.xlsm', '.xls')
+
+def listar_planilhas(entrada):
+    """Planilhas a processar: o próprio arquivo ou as planilhas de um diretório."""
+    entrada = Path(entrada)
+    if entrada.is_dir():
+        # ~$arquivo.xlsx são travas do Excel
+        return sorted(p for p in entrada.iterdir() if p.suffix.lower() in EXTENSOES and not p.name.startswith('~$'))
+    return [entrada]
+
+def _smtp_config():
+    return {
+        'smtp_host': os.environ.get("SMTP_HOST", ""),
+        'smtp_port': os.environ.get("SMTP_PORT", "587"),
+        'smtp_user': os.environ.get("SMTP_USER", ""),
+        'smtp_pass': os.environ.get("SMTP_PASS", ""),
+    }
+
+def processar_arquivo(arquivo, args, pdf_out, zip_out):
+    """Processa uma planilha; devolve um dict de resumo (ok, erro, totais...)."""
+    t0 = time.perf_counter()
+    resumo = {'arquivo': str(arquivo), 'ok': False}
+    proc = processar_planilha(str(arquivo), args.sheet, amostra=0)
+    if proc.resultado is None:
+        resumo['erro'] = "colunas 'VENDEDOR' e 'VALOR DE VENDA' não encontradas"
+        return resumo
+    resumo.update(aba=proc.sheet_name, linhas=proc.linhas_lidas)
+    return entregar(proc.resultado, args, pdf_out, zip_out, resumo, t0)
+
+def processar_dataset(args, pdf_out, zip_out):
+    """Como processar_arquivo, lendo as vendas de um dataset do Power BI."""
+    import powerbi
+    t0 = time.perf_counter()
+    resumo = {'dataset': args.powerbi_dataset, 'ok': False}
+    consulta = powerbi.ConsultaPowerBI(powerbi.PowerBIClient.from_env(), args.powerbi_dataset, args.powerbi_table,
+                                       args.powerbi_seller_col, args.powerbi_value_col, args.powerbi_order_col,
+                                       workspace_id=args.powerbi_workspace)
+    proc = processar_powerbi(consulta, amostra=0, page_size=args.powerbi_page_size)
+    resumo['linhas'] = proc.linhas_lidas
+    return entregar(proc.resultado, args, pdf_out, zip_out, resumo, t0)
+
+def entregar(resultado, args, pdf_out, zip_out, resumo, t0):
+    """Gera o PDF/ZIP e envia os e-mails de um resultado calculado; completa o resumo."""
+    df_results, df_invalidos = resultado.resultados, resultado.invalidos
+    results = resultados_para_linhas(df_results)
+    total_paid = round(float(df_results['total'].sum()), 2)
+    resumo.update(vendedores=len(results), invalidos=len(df_invalidos), total=total_paid)
+
+    pdf_bytes = generate_pdf_report(None, "Relatório de Gratificações", results, totals=total_paid, footer_text="Relatório gerado automaticamente.")
+    if pdf_out:
+        Path(pdf_out).write_bytes(pdf_bytes)
+        resumo['pdf'] = str(pdf_out)
+    if zip_out:
+        generate_statements_zip(str(zip_out), results, workers=args.workers)
+        resumo['zip'] = str(zip_out)
+
+    smtp = _smtp_config()
+    sender = os.environ.get("EMAIL_FROM", "no-reply@example.com")
+    if args.email:
+        recips = [r.strip() for r in (args.recipients or os.environ.get("RECIPIENTS", "")).split(",") if r.strip()]
+        if not recips:
+            raise ValueError("nenhum destinatário (use --recipients ou RECIPIENTS)")
+        send_email(smtp['smtp_host'], smtp['smtp_port'], smtp['smtp_user'], smtp['smtp_pass'], sender, recips,
+                   "Relatório de Gratificações", "Segue em anexo o relatório.",
+                   attachment=pdf_bytes, attachment_name=Path(pdf_out).name if pdf_out else "relatorio_gratificacoes.pdf")
+        resumo['email'] = recips
+    if args.email_sellers:
+        emails = get_seller_emails(df_results['vendedor'])
+        com_email = [r for r in results if emails.get(r['vendedor'])]
+        msgs = [build_message(sender, emails[r['vendedor']], "Demonstrativo de Gratificação",
+                              f"Olá, {r['vendedor']}. Segue em anexo o seu demonstrativo de gratificação.",
+                              attachment=pdf, attachment_name=name)
+                for name, pdf, r in generate_statements(com_email, workers=args.workers)]
+        with BulkMailer(**smtp) as mailer:
+            status = mailer.send_all(msgs)
+        resumo['demonstrativos_enviados'] = sum(1 for s in status if s['ok'])
+        resumo['demonstrativos_falhos'] = [s['to'] for s in status if not s['ok']]
+
+    resumo['segundos'] = round(time.perf_counter() - t0, 3)
+    resumo['ok'] = True
+    return resumo
+
+def cmd_run(args):
+    init_db()
+    if args.powerbi_dataset:
+        try:
+            resumo = processar_dataset(args, args.out or "relatorio.pdf", args.zip)
+        except Exception as e:
+            resumo = {'dataset': args.powerbi_dataset, 'ok': False, 'erro': str(e)}
+        if not resumo['ok']:
+            print(f"ERRO  {resumo['dataset']}: {resumo.get('erro')}", file=sys.stderr)
+            return 1
+        print("OK    " + " ".join(f"{k}={v}" for k, v in resumo.items() if k != 'ok'))
+        return 0
+    arquivos = listar_planilhas(args.input)
+    if not arquivos:
+        print(f"Nenhuma planilha encontrada em {args.input}", file=sys.stderr)
+        return 1
+    varios = len(arquivos) > 1 or Path(args.input).is_dir()
+    if varios:
+        # com vários arquivos, --out e --zip são diretórios de saída
+        out_dir = Path(args.out or ".")
+        zip_dir = Path(args.zip) if args.zip else None
+        for d in (out_dir, zip_dir):
+            if d:
+                d.mkdir(parents=True, exist_ok=True)
+    falhas = 0
+    for arquivo in arquivos:
+        if varios:
+            pdf_out = out_dir / f"{arquivo.stem}.pdf"
+            zip_out = zip_dir / f"{arquivo.stem}_demonstrativos.zip" if zip_dir else None
+        else:
+            pdf_out, zip_out = args.out or "relatorio.pdf", args.zip
+        try:
+            resumo = processar_arquivo(arquivo, args, pdf_out, zip_out)
+        except Exception as e:
+            resumo = {'arquivo': str(arquivo), 'ok': False, 'erro': str(e)}
+        if not resumo['ok']:
+            falhas += 1
+            print(f"ERRO  {resumo['arquivo']}: {resumo.get('erro')}", file=sys.stderr)
+        else:
+            print("OK    " + " ".join(f"{k}={v}" for k, v in resumo.items() if k != 'ok'))
+    return 1 if falhas else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="gratificacoes", description="Cálculo de gratificações sem interface.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="processa planilha(s) de vendas")
+    fonte = run.add_mutually_exclusive_group(required=True)
+    fonte.add_argument("--input", help="planilha .xlsx ou diretório com planilhas")
+    fonte.add_argument("--powerbi-dataset", default=None, help="id do dataset do Power BI de onde ler as vendas")
+    run.add_argument("--sheet", default=None, help="aba a usar (padrão: a primeira)")
+    run.add_argument("--out", default=None, help="PDF de saída (padrão: relatorio.pdf) ou diretório, se --input for um diretório")
+    run.add_argument("--zip", default=None, help="ZIP com os demonstrativos por vendedor (ou diretório)")
+    run.add_argument("--email", action="store_true", help="envia o relatório por e-mail (SMTP_* / RECIPIENTS)")
+    run.add_argument("--recipients", default=None, help="destinatários, separados por vírgula (padrão: RECIPIENTS)")
+    run.add_argument("--email-sellers", action="store_true", help="envia a cada vendedor o seu demonstrativo")
+    run.add_argument("--workers", type=int, default=None, help="processos para gerar os demonstrativos")
+    run.add_argument("--powerbi-workspace", default=None, help="id do workspace do dataset (padrão: Meu workspace)")
+    run.add_argument("--powerbi-table", default="Vendas", help="tabela do dataset com as vendas")
+    run.add_argument("--powerbi-seller-col", default="Vendedor", help="coluna com o vendedor")
+    run.add_argument("--powerbi-value-col", default="Valor", help="coluna com o valor da venda")
+    run.add_argument("--powerbi-order-col", default="Id", help="coluna que identifica cada venda (ordem da paginação)")
+    run.add_argument("--powerbi-page-size", type=int, default=None, help="linhas por página da consulta (padrão: POWERBI_PAGE_SIZE)")
+    run.set_defaults(func=cmd_run)
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    finally:
+        if instrumentacao.ativo() and instrumentacao.LOG_JSON:
+            instrumentacao.registrar_resumo()
+
+if __name__ == "__main__":
+    sys.exit(main())
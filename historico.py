@@ -0,0 +1,92 @@
+"""Histórico de cálculos de gratificação gravado no system.db.
+
+Cada execução (calc_runs) guarda um período AAAA-MM e os resultados por
+vendedor (calc_results). As consultas agregam direto em SQL, sem reprocessar
+planilhas. Gravar de novo um período substitui a execução anterior dele.
+"""
+import re
+from datetime import datetime
+from auth import connection, transaction
+from calculo import normalizar_vendedor
+
+_PERIODO_RE = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+
+def validar_periodo(periodo):
+    periodo = str(periodo).strip()
+    if not _PERIODO_RE.match(periodo):
+        raise ValueError(f"Período inválido: {periodo!r} (use AAAA-MM)")
+    return periodo
+
+def _num(v):
+    # NaN/None viram NULL
+    return None if v is None or v != v else float(v)
+
+def salvar_execucao(periodo, resultados, criado_por=None, arquivo=None, arquivo_hash=None, substituir=True):
+    """Grava uma execução e seus resultados (DataFrame ou lista de dicts) em uma transação.
+
+    Com `substituir`, execuções anteriores do mesmo período são removidas.
+    Devolve o id da execução. Recusa (ValueError) uma execução sem resultados.
+    """
+    periodo = validar_periodo(periodo)
+    rows = resultados.to_dict('records') if hasattr(resultados, 'to_dict') else list(resultados)
+    if not rows:
+        raise ValueError("Nenhum resultado para salvar.")
+    total = round(sum(_num(r.get('total')) or 0.0 for r in rows), 2)
+    with transaction() as cur:
+        if substituir:
+            cur.execute("DELETE FROM calc_results WHERE run_id IN (SELECT id FROM calc_runs WHERE periodo = ?)", (periodo,))
+            cur.execute("DELETE FROM calc_runs WHERE periodo = ?", (periodo,))
+        cur.execute("INSERT INTO calc_runs (periodo, criado_em, criado_por, arquivo, arquivo_hash, total) VALUES (?,?,?,?,?,?)",
+                    (periodo, datetime.now().isoformat(timespec='seconds'), criado_por, arquivo, arquivo_hash, total))
+        run_id = cur.lastrowid
+        cur.executemany("""INSERT INTO calc_results (run_id, periodo, vendedor, vendedor_chave, vendas, meta_100, atingimento, grat_base, bonus, total, linhas)
+                           VALUES (?,?,?,?,?,?,?,?,?,?,?)""",
+                        ((run_id, periodo, r.get('vendedor'), normalizar_vendedor(r.get('vendedor')), _num(r.get('vendas')), _num(r.get('meta_100')),
+                          _num(r.get('atingimento')), _num(r.get('grat_base')), _num(r.get('bonus')), _num(r.get('total')),
+                          int(r['linhas']) if r.get('linhas') is not None else None)
+                         for r in rows))
+    return run_id
+
+def listar_execucoes(limit=100):
+    with connection() as conn:
+        rows = conn.execute("""SELECT r.id, r.periodo, r.criado_em, r.criado_por, r.arquivo, r.total, COUNT(c.id) AS vendedores
+                               FROM calc_runs r LEFT JOIN calc_results c ON c.run_id = r.id
+                               GROUP BY r.id ORDER BY r.periodo DESC, r.id DESC LIMIT ?""", (limit,)).fetchall()
+    return [dict(r) for r in rows]
+
+def resultados_execucao(run_id):
+    with connection() as conn:
+        rows = conn.execute("""SELECT vendedor, vendas, meta_100, atingimento, grat_base, bonus, total, linhas
+                               FROM calc_results WHERE run_id = ? ORDER BY id""", (run_id,)).fetchall()
+    return [dict(r) for r in rows]
+
+def totais_por_periodo(inicio=None, fim=None):
+    """Total pago, vendas e número de vendedores por período."""
+    with connection() as conn:
+        rows = conn.execute("""SELECT periodo, SUM(total) AS total, SUM(vendas) AS vendas, COUNT(*) AS vendedores
+                               FROM calc_results WHERE periodo BETWEEN ? AND ?
+                               GROUP BY periodo ORDER BY periodo""", (inicio or '0000-00', fim or '9999-99')).fetchall()
+    return [dict(r) for r in rows]
+
+def tendencia_vendedor(vendedor, inicio=None, fim=None):
+    """Evolução mês a mês de um vendedor (nome comparado sem caixa/acentos)."""
+    with connection() as conn:
+        rows = conn.execute("""SELECT periodo, SUM(vendas) AS vendas, MAX(meta_100) AS meta_100, SUM(total) AS total
+                               FROM calc_results WHERE vendedor_chave = ? AND periodo BETWEEN ? AND ?
+                               GROUP BY periodo ORDER BY periodo""",
+                            (normalizar_vendedor(vendedor), inicio or '0000-00', fim or '9999-99')).fetchall()
+    return [dict(r) for r in rows]
+
+def acumulado_ano(ano, ate_mes=12):
+    """Totais acumulados no ano (year-to-date) por vendedor, do maior para o menor."""
+    with connection() as conn:
+        rows = conn.execute("""SELECT MIN(vendedor) AS vendedor, SUM(vendas) AS vendas, SUM(total) AS total, COUNT(DISTINCT periodo) AS meses
+                               FROM calc_results WHERE periodo BETWEEN ? AND ?
+                               GROUP BY vendedor_chave ORDER BY total DESC""",
+                            (f"{int(ano):04d}-01", f"{int(ano):04d}-{int(ate_mes):02d}")).fetchall()
+    return [dict(r) for r in rows]
+
+def listar_vendedores():
+    with connection() as conn:
+        rows = conn.execute("SELECT MIN(vendedor) AS vendedor FROM calc_results GROUP BY vendedor_chave ORDER BY 1").fetchall()
+    return [r['vendedor'] for r in rows]
@@ -0,0 +1,195 @@
+"""Leitura de planilhas de vendas em blocos.
+
+Só a aba escolhida e só as colunas VENDEDOR / VALOR DE VENDA são lidas, em modo
+read-only do openpyxl, de forma que o uso de memória não cresce com o tamanho
+do arquivo.
+"""
+import sys
+import zipfile
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+HEADER_SCAN_ROWS = 20
+CHUNK_SIZE = 50_000
+
+def _rewind(source):
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return source
+
+def _open_workbook(source):
+    return load_workbook(_rewind(source), read_only=True, data_only=True)
+
+def listar_abas(source):
+    """Nomes das abas da planilha (lê apenas o índice do arquivo)."""
+    try:
+        wb = _open_workbook(source)
+    except (InvalidFileException, zipfile.BadZipFile):
+        return list(pd.ExcelFile(_rewind(source)).sheet_names)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+def detectar_colunas(cabecalho):
+    """Índices das colunas de vendedor e de valor de venda em uma linha de cabeçalho."""
+    seller_idx = None
+    value_idx = None
+    for i, c in enumerate(cabecalho):
+        k = str(c).strip().upper() if c is not None else ''
+        if 'VENDEDOR' in k:
+            seller_idx = i
+        if 'VALOR' in k and 'VENDA' in k:
+            value_idx = i
+    return seller_idx, value_idx
+
+_PLACEHOLDERS = ['', '-', '–', '—']
+# ponto só é separador de milhar quando agrupa de três em três: 1.234 / 12.345.678,90
+_MILHAR = r'[+-]?\d{1,3}(?:\.\d{3})+(?:,\d+)?'
+
+def converter_valores(valores):
+    """Converte uma coluna de valores de venda em float, de uma vez.
+
+    Aceita números e textos em formato brasileiro ("R$ 1.234,56", "(1.234,56)"
+    para negativos, "-" como vazio). Devolve `(valores, invalidos)`: um array
+    float (NaN onde não há valor) e uma máscara booleana das células que não
+    puderam ser interpretadas, para que sejam reportadas em vez de virarem 0.
+    Textos com ponto decimal ("1.5", "R$ 1,234.56") e parênteses sem par são
+    inválidos: não dá para saber o valor pretendido.
+    """
+    s = pd.Series(valores, dtype=object).reset_index(drop=True)
+    out = np.full(len(s), np.nan)
+    invalidos = np.zeros(len(s), dtype=bool)
+
+    # só as células de texto passam pela limpeza de string (.str exige texto)
+    eh_texto = np.fromiter((isinstance(v, str) for v in s), dtype=bool, count=len(s))
+    texto = s[eh_texto].astype(str).str.strip()
+
+    outros = s[~eh_texto]
+    nums = pd.to_numeric(outros, errors='coerce')
+    out[~eh_texto] = nums.to_numpy(dtype=float, na_value=np.nan)
+    invalidos[~eh_texto] = (outros.notna() & nums.isna()).to_numpy()
+
+    t = texto.str.replace(r'R\$|\s', '', regex=True)
+    vazio = t.isin(_PLACEHOLDERS)
+    negativo = t.str.match(r'^\(.*\)$')
+    t = t.str.replace(r'^\((.*)\)$', r'\1', regex=True)
+    # "(-5)" ou parênteses que sobraram: sinal ambíguo
+    ok = ~t.str.contains(r'[()]') & ~(negativo & t.str.match(r'^[+-]'))
+    milhar = t.str.fullmatch(_MILHAR)
+    ok &= milhar | ~t.str.contains('.', regex=False)
+    t = t.where(~milhar, t.str.replace('.', '', regex=False)).str.replace(',', '.', regex=False)
+    ok &= t.str.fullmatch(r'[+-]?\d+(?:\.\d+)?') & ~vazio
+    nums = pd.to_numeric(t.where(ok), errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    out[eh_texto] = np.where(negativo.to_numpy(), -nums, nums)
+    invalidos[eh_texto] = (~ok & ~vazio).to_numpy()
+    return out, invalidos
+
+def pico_memoria_mb():
+    """Pico de memória residente do processo (MB), ou None se indisponível."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+class LeituraPlanilha:
+    """Planilha de vendas aberta para leitura em blocos.
+
+    O cabeçalho é procurado nas primeiras `header_scan_rows` linhas da aba.
+    Se as colunas não forem encontradas, `seller_col`/`value_col` ficam None.
+    Arquivos que o openpyxl não abre (.xls) são lidos inteiros via pandas.
+    """
+
+    def __init__(self, source, sheet_name=None, header_scan_rows=HEADER_SCAN_ROWS):
+        self.source = source
+        self.header_row = None
+        self.seller_col = None
+        self.value_col = None
+        self.linhas_lidas = 0
+        self._frame = None
+        try:
+            self._wb = _open_workbook(source)
+        except (InvalidFileException, zipfile.BadZipFile):
+            self._wb = None
+        if self._wb is not None:
+            ws = self._wb[sheet_name] if sheet_name else self._wb.worksheets[0]
+            self.sheet_name = ws.title
+            self._ws = ws
+            head = list(ws.iter_rows(max_row=header_scan_rows, values_only=True))
+        else:
+            self.sheet_name = sheet_name or listar_abas(source)[0]
+            self._frame = pd.read_excel(_rewind(source), sheet_name=self.sheet_name, header=None)
+            head = list(self._frame.head(header_scan_rows).itertuples(index=False, name=None))
+        for i, row in enumerate(head):
+            seller_idx, value_idx = detectar_colunas(row)
+            if seller_idx is not None and value_idx is not None:
+                self.header_row = i
+                self._seller_idx, self._value_idx = seller_idx, value_idx
+                self.seller_col = str(row[seller_idx]).strip()
+                self.value_col = str(row[value_idx]).strip()
+                break
+
+    def amostra(self, n=50):
+        """Primeiras `n` linhas da aba, todas as colunas (para pré-visualização)."""
+        start = self.header_row if self.header_row is not None else 0
+        if self._frame is not None:
+            rows = list(self._frame.iloc[start:start + n + 1].itertuples(index=False, name=None))
+        else:
+            rows = list(self._ws.iter_rows(min_row=start + 1, max_row=start + n + 1, values_only=True))
+        if not rows:
+            return pd.DataFrame()
+        header = [str(c) if c is not None else f"col_{i}" for i, c in enumerate(rows[0])]
+        return pd.DataFrame(rows[1:], columns=header)
+
+    def blocos(self, chunk_size=CHUNK_SIZE):
+        """Gera DataFrames de até `chunk_size` linhas com as colunas `vendedor` e `valor` (brutas).
+
+        A coluna `linha` traz o número da linha na planilha, para relatar erros.
+        """
+        if self.header_row is None:
+            return
+        lo = min(self._seller_idx, self._value_idx)
+        si, vi = self._seller_idx - lo, self._value_idx - lo
+        if self._frame is not None:
+            body = self._frame.iloc[self.header_row + 1:]
+            rows = body.iloc[:, [self._seller_idx, self._value_idx]].itertuples(index=False, name=None)
+            si, vi = 0, 1
+        else:
+            rows = self._ws.iter_rows(min_row=self.header_row + 2, min_col=lo + 1,
+                                      max_col=max(self._seller_idx, self._value_idx) + 1, values_only=True)
+        linhas, vendedores, valores = [], [], []
+        for linha, row in enumerate(rows, start=self.header_row + 2):
+            if len(row) <= max(si, vi):
+                row = tuple(row) + (None,) * (max(si, vi) + 1 - len(row))
+            if pd.isna(row[si]) and pd.isna(row[vi]):
+                continue
+            linhas.append(linha)
+            vendedores.append(row[si])
+            valores.append(row[vi])
+            if len(vendedores) >= chunk_size:
+                self.linhas_lidas += len(vendedores)
+                yield pd.DataFrame({'linha': linhas, 'vendedor': vendedores, 'valor': valores})
+                linhas, vendedores, valores = [], [], []
+        if vendedores:
+            self.linhas_lidas += len(vendedores)
+            yield pd.DataFrame({'linha': linhas, 'vendedor': vendedores, 'valor': valores})
+
+    def close(self):
+        if self._wb is not None:
+            self._wb.close()
+            self._wb = None
+        self._frame = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
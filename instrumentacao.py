@@ -0,0 +1,140 @@
+"""Instrumentação leve: tempos e contadores dos pontos quentes do sistema.
+
+Desligada por padrão; liga com INSTRUMENTACAO=1 ou `ativar()` (painel de
+diagnóstico do admin). Desligada, cada função medida custa só a checagem de
+uma flag. As estatísticas são do processo inteiro (todas as sessões).
+
+Com INSTRUMENTACAO_LOG=1 cada medição de pelo menos INSTRUMENTACAO_LOG_MIN_MS
+vira uma linha JSON no logger "gratificacoes.instrumentacao" (stderr se não
+houver handler configurado).
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+_ligado = os.environ.get("INSTRUMENTACAO", "").lower() in ("1", "true", "sim", "yes")
+LOG_JSON = os.environ.get("INSTRUMENTACAO_LOG", "").lower() in ("1", "true", "sim", "yes")
+LOG_MIN_MS = float(os.environ.get("INSTRUMENTACAO_LOG_MIN_MS", "1"))
+
+logger = logging.getLogger("gratificacoes.instrumentacao")
+if LOG_JSON and not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+_lock = threading.Lock()
+_tempos = {}     # nome -> [chamadas, segundos, maior, erros]
+_contadores = {}  # nome -> total
+_nulo = nullcontext()
+
+def ativo():
+    return _ligado
+
+def ativar(ligado=True):
+    global _ligado
+    _ligado = bool(ligado)
+
+def resetar():
+    with _lock:
+        _tempos.clear()
+        _contadores.clear()
+
+def _registrar(nome, segundos, erro=False):
+    with _lock:
+        t = _tempos.get(nome)
+        if t is None:
+            t = _tempos[nome] = [0, 0.0, 0.0, 0]
+        t[0] += 1
+        t[1] += segundos
+        if segundos > t[2]:
+            t[2] = segundos
+        if erro:
+            t[3] += 1
+    if LOG_JSON and segundos * 1000 >= LOG_MIN_MS:
+        logger.info(json.dumps({'evento': 'tempo', 'nome': nome, 'ms': round(segundos * 1000, 3), 'erro': erro,
+                                'thread': threading.current_thread().name, 'ts': round(time.time(), 3)}))
+
+def contar(nome, n=1):
+    if not _ligado:
+        return
+    with _lock:
+        _contadores[nome] = _contadores.get(nome, 0) + n
+
+def medido(nome=None):
+    """Decorador: mede tempo e chamadas da função (nome padrão: modulo.funcao)."""
+    def deco(func):
+        rotulo = nome or f"{func.__module__}.{func.__qualname__}"
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _ligado:
+                return func(*args, **kwargs)
+            t0 = time.perf_counter()
+            erro = True
+            try:
+                resultado = func(*args, **kwargs)
+                erro = False
+                return resultado
+            finally:
+                _registrar(rotulo, time.perf_counter() - t0, erro)
+        return wrapper
+    return deco
+
+@contextmanager
+def _medir(nome):
+    t0 = time.perf_counter()
+    erro = True
+    try:
+        yield
+        erro = False
+    finally:
+        _registrar(nome, time.perf_counter() - t0, erro)
+
+def medir(nome):
+    """Context manager para medir um trecho (ex.: renderização de uma tabela)."""
+    return _medir(nome) if _ligado else _nulo
+
+def medir_iteracao(nome, iteravel):
+    """Mede o tempo gasto produzindo cada item de um gerador (ex.: blocos lidos da planilha)."""
+    if not _ligado:
+        return iteravel
+    def gerar():
+        it = iter(iteravel)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            _registrar(nome, time.perf_counter() - t0)
+            yield item
+    return gerar()
+
+def _sql_executado(sql):
+    if not _ligado:
+        return
+    tipo = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else '?'
+    with _lock:
+        _contadores['db.queries'] = _contadores.get('db.queries', 0) + 1
+        _contadores[f'db.{tipo}'] = _contadores.get(f'db.{tipo}', 0) + 1
+
+def rastrear_conexao(conn):
+    """Conta os comandos SQL executados na conexão (sqlite3 set_trace_callback)."""
+    if _ligado:
+        conn.set_trace_callback(_sql_executado)
+
+def resumo():
+    """Estatísticas atuais: {'tempos': [...], 'contadores': {...}}, tempos do maior total para o menor."""
+    with _lock:
+        tempos = [{'nome': k, 'chamadas': c, 'total_ms': round(s * 1000, 3), 'media_ms': round(s * 1000 / c, 3) if c else 0.0,
+                   'max_ms': round(m * 1000, 3), 'erros': e}
+                  for k, (c, s, m, e) in _tempos.items()]
+        contadores = dict(_contadores)
+    tempos.sort(key=lambda t: t['total_ms'], reverse=True)
+    return {'tempos': tempos, 'contadores': contadores}
+
+def registrar_resumo():
+    """Escreve o resumo atual como uma linha JSON no logger (ex.: ao fim de uma execução headless)."""
+    logger.info(json.dumps({'evento': 'resumo', **resumo()}))
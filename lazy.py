@@ -0,0 +1,46 @@
+"""Importação preguiçosa de módulos pesados.
+
+`lazy_import("pdfgen")` devolve um substituto sem importar nada; o import de
+verdade (e dos módulos que ele importa, como o reportlab) acontece no primeiro
+acesso a um atributo. Use sempre `modulo.funcao(...)`, pois `from x import y`
+força o carregamento imediato.
+
+O import é feito por importlib.import_module, que usa as travas por módulo do
+sistema de import: threads que chegam juntas esperam o módulo terminar de
+carregar. O importlib.util.LazyLoader não é seguro entre threads antes do
+Python 3.12.3 e podia expor um módulo pela metade.
+"""
+import importlib
+import importlib.util
+import sys
+
+class _ModuloPreguicoso:
+    __slots__ = ('_nome', '_modulo')
+
+    def __init__(self, nome):
+        object.__setattr__(self, '_nome', nome)
+        object.__setattr__(self, '_modulo', None)
+
+    def _carregar(self):
+        modulo = self._modulo
+        if modulo is None:
+            modulo = importlib.import_module(self._nome)
+            object.__setattr__(self, '_modulo', modulo)
+        return modulo
+
+    def __getattr__(self, attr):
+        return getattr(self._carregar(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._carregar(), attr, value)
+
+    def __repr__(self):
+        estado = 'carregado' if self._modulo is not None else 'não carregado'
+        return f"<módulo preguiçoso {self._nome!r} ({estado})>"
+
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    return _ModuloPreguicoso(name)
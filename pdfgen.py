@@ -1,21 +1,50 @@
-
+import io
+import math
+import multiprocessing
+import os
+import re
+import unicodedata
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import mm
 from reportlab.lib import colors
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.platypus import Table, TableStyle, Paragraph, SimpleDocTemplate, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
+from instrumentacao import medido
+
+HEADER = ['Vendedor','Vendas','Meta 100%','% Atingido','Gratificação Base','Bônus','Total Pago']
+# acima deste número de linhas o relatório é desenhado direto no canvas
+FAST_MODE_MIN_ROWS = 1000
+# processos usados para gerar demonstrativos em lote (padrão: núcleos da máquina)
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", "0")) or os.cpu_count() or 1
+
+def _format_row(r):
+    return [r.get('vendedor'), f"R$ {r.get('vendas'):,}", f"R$ {r.get('meta_100'):,}", f"{r.get('atingimento')*100:.2f}%" if r.get('atingimento') is not None else '-', f"R$ {r.get('grat_base'):,}", f"R$ {r.get('bonus'):,}", f"R$ {r.get('total'):,}"]
 
-def generate_pdf_report(filename, report_title, rows, totals=None, footer_text=None):
-    doc = SimpleDocTemplate(filename, pagesize=A4, rightMargin=20,leftMargin=20, topMargin=20,bottomMargin=20)
+@medido()
+def generate_pdf_report(filename, report_title, rows, totals=None, footer_text=None, fast=None):
+    """Gera o relatório em PDF. `fast=None` escolhe o modo canvas para relatórios grandes.
+
+    `filename` pode ser um caminho, um arquivo em memória (BytesIO) ou None;
+    com None nada é gravado em disco e a função devolve os bytes do PDF.
+    """
+    if fast is None:
+        fast = len(rows) >= FAST_MODE_MIN_ROWS
+    if fast:
+        return render_report_canvas(filename, report_title, rows, totals=totals, footer_text=footer_text)
+    out = io.BytesIO() if filename is None else filename
+    doc = SimpleDocTemplate(out, pagesize=A4, rightMargin=20,leftMargin=20, topMargin=20,bottomMargin=20)
     styles = getSampleStyleSheet()
     elems = []
     elems.append(Paragraph(report_title, styles['Title']))
     elems.append(Spacer(1,6))
     # Table data
-    data = [['Vendedor','Vendas','Meta 100%','% Atingido','Gratificação Base','Bônus','Total Pago']]
+    data = [HEADER]
     for r in rows:
-        data.append([r.get('vendedor'), f"R$ {r.get('vendas'):,}", f"R$ {r.get('meta_100'):,}", f"{r.get('atingimento')*100:.2f}%" if r.get('atingimento') is not None else '-', f"R$ {r.get('grat_base'):,}", f"R$ {r.get('bonus'):,}", f"R$ {r.get('total'):,}"])
+        data.append(_format_row(r))
     if totals:
         data.append(['TOTAL','','','','','', f"R$ {totals:,}"])
     t = Table(data, repeatRows=1)
@@ -28,4 +57,175 @@ def generate_pdf_report(filename, report_title, rows, totals=None, footer_text=N
     if footer_text:
         elems.append(Paragraph(footer_text, styles['Normal']))
     doc.build(elems)
+    if filename is None:
+        return out.getvalue()
     return filename
+
+class _CanvasLayout:
+    """Geometria e estilos do modo canvas, calculados uma única vez."""
+    margin = 20
+    font = 'Helvetica'
+    font_bold = 'Helvetica-Bold'
+    font_size = 7.5
+    row_height = 13
+    header_color = colors.HexColor('#2E86C1')
+    # largura relativa de cada coluna (vendedor mais larga)
+    weights = [2.4, 1.2, 1.2, 0.9, 1.2, 1.1, 1.2]
+
+    def __init__(self, pagesize=A4):
+        self.width, self.height = pagesize
+        usable = self.width - 2 * self.margin
+        scale = usable / sum(self.weights)
+        self.xs = [self.margin]
+        for w in self.weights:
+            self.xs.append(self.xs[-1] + w * scale)
+        self.col_widths = [b - a for a, b in zip(self.xs, self.xs[1:])]
+        self.pad = 3
+        self.top = self.height - self.margin
+        self.bottom = self.margin + 14  # espaço do rodapé de página
+
+    def fit(self, text, col):
+        # corta textos longos para caber na coluna
+        limit = self.col_widths[col] - 2 * self.pad
+        if stringWidth(text, self.font, self.font_size) <= limit:
+            return text
+        while text and stringWidth(text + '…', self.font, self.font_size) > limit:
+            text = text[:-1]
+        return text + '…'
+
+def render_report_canvas(output, report_title, rows, totals=None, footer_text=None):
+    """Modo de alto volume: desenha as linhas direto no canvas, página a página.
+
+    Evita o layout de tabela do platypus (que mede a tabela inteira), usando
+    posições de coluna pré-calculadas e uma grade por página. `output` pode ser
+    um caminho ou um arquivo em memória; se for None, devolve os bytes do PDF.
+    """
+    buf = io.BytesIO() if output is None else output
+    lay = _CanvasLayout()
+    c = canvas.Canvas(buf, pagesize=(lay.width, lay.height), pageCompression=1)
+    c.setTitle(report_title)
+
+    data = [_format_row(r) for r in rows]
+    if totals:
+        data.append(['TOTAL', '', '', '', '', '', f"R$ {totals:,}"])
+
+    page = 0
+    i = 0
+    first = True
+    while first or i < len(data):
+        page += 1
+        y = lay.top
+        if first:
+            c.setFont(lay.font_bold, 14)
+            c.drawCentredString(lay.width / 2, y - 14, report_title)
+            y -= 28
+        avail = int((y - lay.bottom) // lay.row_height) - 1
+        chunk = data[i:i + max(avail, 0)]
+        i += len(chunk)
+        # cabeçalho da tabela em todas as páginas
+        c.setFillColor(lay.header_color)
+        c.rect(lay.xs[0], y - lay.row_height, lay.xs[-1] - lay.xs[0], lay.row_height, stroke=0, fill=1)
+        c.setFillColor(colors.white)
+        c.setFont(lay.font_bold, lay.font_size)
+        base = y - lay.row_height + 4
+        for col, text in enumerate(HEADER):
+            c.drawString(lay.xs[col] + lay.pad, base, lay.fit(text, col))
+        c.setFillColor(colors.black)
+        c.setFont(lay.font, lay.font_size)
+        for n, cells in enumerate(chunk, start=1):
+            base = y - (n + 1) * lay.row_height + 4
+            c.drawString(lay.xs[0] + lay.pad, base, lay.fit(str(cells[0]), 0))
+            for col in range(1, len(cells)):
+                if cells[col]:
+                    c.drawRightString(lay.xs[col + 1] - lay.pad, base, cells[col])
+        ys = [y - k * lay.row_height for k in range(len(chunk) + 2)]
+        c.setStrokeColor(colors.grey)
+        c.setLineWidth(0.5)
+        c.grid(lay.xs, ys)
+        y = ys[-1]
+        last = i >= len(data)
+        c.setFont(lay.font, 7)
+        c.drawRightString(lay.width - lay.margin, lay.margin, f"Página {page}")
+        if last and footer_text:
+            if y - 18 < lay.bottom:
+                c.showPage()
+                page += 1
+                y = lay.top
+                c.setFont(lay.font, 7)
+                c.drawRightString(lay.width - lay.margin, lay.margin, f"Página {page}")
+            c.setFont(lay.font, 9)
+            c.drawString(lay.margin, y - 18, footer_text)
+        first = False
+        if not last:
+            c.showPage()
+    c.save()
+    if output is None:
+        return buf.getvalue()
+    return output
+
+def statement_filename(vendedor):
+    """Nome de arquivo do demonstrativo de um vendedor (sem acentos/espaços)."""
+    nome = unicodedata.normalize('NFKD', str(vendedor)).encode('ascii', 'ignore').decode('ascii')
+    nome = re.sub(r'[^A-Za-z0-9]+', '_', nome).strip('_') or 'vendedor'
+    return f"demonstrativo_{nome}.pdf"
+
+@medido()
+def generate_seller_statement(output, row, footer_text="Demonstrativo gerado automaticamente."):
+    """Demonstrativo individual (uma linha de resultado) de um vendedor."""
+    return generate_pdf_report(output, f"Demonstrativo de Gratificação — {row.get('vendedor')}", [row],
+                               totals=row.get('total'), footer_text=footer_text, fast=False)
+
+def _render_statement_chunk(rows, footer_text):
+    # executado nos processos do pool: precisa ser uma função de módulo
+    return [generate_seller_statement(None, r, footer_text=footer_text) for r in rows]
+
+def generate_statements(rows, workers=None, chunk_size=None, footer_text="Demonstrativo gerado automaticamente."):
+    """Gera os demonstrativos de vários vendedores em paralelo (ProcessPoolExecutor).
+
+    Produz `(nome_do_arquivo, pdf_bytes, row)` na mesma ordem de `rows`, à medida
+    que os blocos de `chunk_size` linhas ficam prontos. Com `workers=1` roda no
+    próprio processo.
+    """
+    rows = list(rows)
+    workers = max(1, int(workers or PDF_WORKERS))
+    if not chunk_size:
+        # blocos pequenos o bastante para equilibrar os processos
+        chunk_size = max(1, min(50, math.ceil(len(rows) / (workers * 4))))
+    chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+    used = set()
+
+    def _named(chunk, pdfs):
+        for r, pdf in zip(chunk, pdfs):
+            name = statement_filename(r.get('vendedor'))
+            base, n = name[:-4], 2
+            # sem distinguir maiúsculas, para extrair bem em qualquer sistema
+            while name.lower() in used:
+                name = f"{base}_{n}.pdf"
+                n += 1
+            used.add(name.lower())
+            yield name, pdf, r
+
+    if workers == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield from _named(chunk, _render_statement_chunk(chunk, footer_text))
+        return
+    # spawn: um fork do servidor Streamlit (várias threads, locks do sqlite e
+    # do logging) pode deixar os processos filhos travados
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=multiprocessing.get_context('spawn')) as pool:
+        for chunk, pdfs in zip(chunks, pool.map(_render_statement_chunk, chunks, [footer_text] * len(chunks))):
+            yield from _named(chunk, pdfs)
+
+@medido()
+def generate_statements_zip(output, rows, workers=None, chunk_size=None, footer_text="Demonstrativo gerado automaticamente."):
+    """Demonstrativos por vendedor (ver generate_statements) gravados em um ZIP.
+
+    Os PDFs são escritos no ZIP conforme ficam prontos. `output` segue a regra
+    de generate_pdf_report: caminho, arquivo em memória ou None (devolve bytes).
+    """
+    out = io.BytesIO() if output is None else output
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for name, pdf, _ in generate_statements(rows, workers=workers, chunk_size=chunk_size, footer_text=footer_text):
+            zf.writestr(name, pdf)
+    if output is None:
+        return out.getvalue()
+    return output
@@ -0,0 +1,200 @@
+"""Cálculo das gratificações a partir dos blocos lidos da planilha.
+
+As vendas são primeiro somadas por vendedor (nome normalizado: sem diferença de
+caixa, espaços ou acentos) e a gratificação é calculada uma vez por vendedor.
+"""
+import threading
+import tracemalloc
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from auth import get_metas, metas_version, metas_changes_since
+from calculo import calcular_gratificacao_lote, arredondar, normalizar_vendedores
+from ingestao import LeituraPlanilha, converter_valores, CHUNK_SIZE
+from instrumentacao import medido, medir_iteracao
+
+COLUNAS_RESULTADO = ['vendedor', 'vendas', 'meta_100', 'atingimento', 'grat_base', 'bonus', 'total', 'linhas']
+COLUNAS_INVALIDOS = ['linha', 'vendedor', 'valor']
+COLUNAS_LINHAS = ['linha', 'chave', 'vendas']
+SEM_NOME = '(sem nome)'
+
+# resultados: um registro por vendedor; invalidos: linhas com valor ilegível;
+# linhas: detalhamento linha a linha (só quando pedido); agregado: vendas somadas
+# por vendedor; versoes: versão das metas com que cada vendedor foi calculado
+ResultadoPlanilha = namedtuple('ResultadoPlanilha', ['resultados', 'invalidos', 'linhas', 'agregado', 'versoes'])
+# planilha lida + calculada; resultado é None se as colunas não foram encontradas;
+# pico_mb: pico de memória alocada durante o processamento (None se não medido)
+Processamento = namedtuple('Processamento', ['sheet_name', 'seller_col', 'value_col', 'linhas_lidas', 'amostra', 'resultado',
+                                             'pico_mb'], defaults=(None,))
+_memoria_lock = threading.Lock()
+
+def _com_pico_memoria(func):
+    """`(func(), pico_mb)` medido pelo tracemalloc.
+
+    O tracemalloc é do processo inteiro: se outro processamento já está sendo
+    medido (ou alguém já ligou o tracemalloc), roda sem medir e o pico é None.
+    """
+    if tracemalloc.is_tracing() or not _memoria_lock.acquire(blocking=False):
+        return func(), None
+    tracemalloc.start()
+    try:
+        valor = func()
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        _memoria_lock.release()
+    return valor, pico / (1024 * 1024)
+
+@medido()
+def preparar_bloco(bloco):
+    """Normaliza um bloco bruto (`linha`, `vendedor`, `valor`).
+
+    Devolve `(linhas, invalidos)`: `linhas` com colunas linha, chave, vendedor e
+    vendas (float, NaN sem valor); `invalidos` com as linhas cujo valor não pôde
+    ser interpretado (elas entram no cálculo sem venda).
+    """
+    nomes = bloco['vendedor'].map(lambda v: str(v).strip() if pd.notna(v) else "")
+    # normalize numeric values (handle strings with R$ etc)
+    vendas, invalidos = converter_valores(bloco['valor'])
+    linhas = pd.DataFrame({
+        'linha': bloco['linha'].to_numpy(),
+        'chave': normalizar_vendedores(nomes).to_numpy(),
+        'vendedor': nomes.to_numpy(),
+        'vendas': vendas,
+    })
+    return linhas, bloco.loc[invalidos, COLUNAS_INVALIDOS]
+
+def _somar(linhas):
+    # n_vendas distingue "sem nenhum valor" (vendas fica NaN) de soma zero
+    return linhas.groupby('chave', sort=False).agg(
+        vendedor=('vendedor', 'first'), vendas=('vendas', 'sum'),
+        n_vendas=('vendas', 'count'), linhas=('linha', 'size'))
+
+def _combinar(parciais):
+    df = pd.concat(parciais).groupby(level=0, sort=False).agg(
+        vendedor=('vendedor', 'first'), vendas=('vendas', 'sum'),
+        n_vendas=('n_vendas', 'sum'), linhas=('linhas', 'sum'))
+    df['vendas'] = df['vendas'].where(df['n_vendas'] > 0)
+    return df.drop(columns='n_vendas')
+
+@medido()
+def calcular_por_vendedor(agregado):
+    """Gratificações a partir das vendas somadas por vendedor (colunas vendedor, vendas, linhas)."""
+    nomes = agregado['vendedor']
+    vendas = agregado['vendas'].to_numpy(dtype=float, na_value=np.nan)
+
+    # bulk meta lookup (cached in memory)
+    metas_vend = {v: m or {} for v, m in get_metas(nomes.unique()).items()}
+    def meta_col(campo):
+        return nomes.map(lambda v: metas_vend[v].get(campo)).to_numpy(dtype=float, na_value=0.0)
+    meta_100 = meta_col('meta_100')
+
+    calc = calcular_gratificacao_lote(vendas, meta_col('meta_min'), meta_100, meta_col('gratificacao_100'), meta_col('bonus_pct'))
+    df = pd.DataFrame({
+        'vendedor': nomes.replace("", SEM_NOME).to_numpy(),
+        'vendas': np.nan_to_num(arredondar(vendas, 2), nan=0.0),
+        'meta_100': meta_100,
+    })
+    df = pd.concat([df, calc], axis=1)
+    df['linhas'] = agregado['linhas'].to_numpy()
+    df.index = agregado.index
+    return df[COLUNAS_RESULTADO]
+
+@medido()
+def calcular_resultados(blocos, manter_linhas=False):
+    """Processa os blocos um a um, somando por vendedor, e calcula cada vendedor uma vez.
+
+    Devolve um ResultadoPlanilha; o índice de `resultados` é a chave normalizada
+    do vendedor. Com `manter_linhas`, guarda também o detalhamento por linha.
+    """
+    parciais, ruins, detalhe = [], [], []
+    # tempo de leitura de cada bloco (planilha ou Power BI) medido à parte do cálculo
+    for bloco in medir_iteracao('ingestao.blocos', blocos):
+        linhas, inv = preparar_bloco(bloco)
+        parciais.append(_somar(linhas))
+        ruins.append(inv)
+        if manter_linhas:
+            detalhe.append(linhas[COLUNAS_LINHAS])
+    if not parciais:
+        vazio = pd.DataFrame(columns=COLUNAS_RESULTADO)
+        return ResultadoPlanilha(vazio, pd.DataFrame(columns=COLUNAS_INVALIDOS), pd.DataFrame(columns=COLUNAS_LINHAS) if manter_linhas else None,
+                                 pd.DataFrame(columns=['vendedor', 'vendas', 'linhas']), pd.Series(dtype='int64'))
+    df_linhas = None
+    if manter_linhas:
+        df_linhas = pd.concat(detalhe, ignore_index=True)
+        df_linhas['chave'] = df_linhas['chave'].astype('category')
+    agregado = _combinar(parciais)
+    # versão lida antes do cálculo: uma meta salva durante o cálculo fica pendente
+    versao = metas_version()
+    resultados = calcular_por_vendedor(agregado)
+    versoes = pd.Series(versao, index=resultados.index, dtype='int64')
+    return ResultadoPlanilha(resultados, pd.concat(ruins, ignore_index=True), df_linhas, agregado, versoes)
+
+_sync_lock = threading.Lock()
+
+@medido()
+def sincronizar_metas(resultado, publicar=None):
+    """Recalcula só os vendedores cujas metas mudaram desde o cálculo de `resultado`.
+
+    `resultado` nunca é alterado: ele pode estar no cache, sendo lido por outras
+    sessões. Devolve `(novo_resultado, chaves_recalculadas)`, com cópias dos
+    frames alterados, ou `(resultado, [])` se nada mudou. `publicar(novo)` é
+    chamado ainda sob o lock, para trocar a entrada do cache de uma vez.
+    """
+    with _sync_lock:
+        versoes = resultado.versoes
+        if versoes.empty:
+            return resultado, []
+        versao = metas_version()
+        changes = metas_changes_since(int(versoes.min()))
+        if changes is None:
+            stale = list(versoes.index)
+        else:
+            stale = [k for k, v in changes.items() if k in versoes.index and versoes[k] < v]
+        if not stale:
+            return resultado, []
+        novos = calcular_por_vendedor(resultado.agregado.loc[stale])
+        resultados = resultado.resultados.copy()
+        resultados.loc[stale, COLUNAS_RESULTADO] = novos[COLUNAS_RESULTADO]
+        versoes = versoes.copy()
+        versoes.loc[stale] = versao
+        novo = resultado._replace(resultados=resultados, versoes=versoes)
+        if publicar is not None:
+            publicar(novo)
+        return novo, stale
+
+def processar_planilha(source, sheet_name=None, manter_linhas=False, chunk_size=CHUNK_SIZE, amostra=50, medir_memoria=False):
+    """Lê a aba escolhida em blocos e calcula as gratificações. Devolve um Processamento.
+
+    Com `medir_memoria`, o pico de memória da leitura + cálculo vai em `pico_mb`
+    (o tracemalloc deixa o processamento mais lento).
+    """
+    def processar():
+        with LeituraPlanilha(source, sheet_name) as leitura:
+            preview = leitura.amostra(amostra) if amostra else None
+            resultado = None
+            if leitura.seller_col is not None and leitura.value_col is not None:
+                resultado = calcular_resultados(leitura.blocos(chunk_size), manter_linhas=manter_linhas)
+            return Processamento(leitura.sheet_name, leitura.seller_col, leitura.value_col, leitura.linhas_lidas, preview, resultado)
+    if not medir_memoria:
+        return processar()
+    proc, pico = _com_pico_memoria(processar)
+    return proc._replace(pico_mb=pico)
+
+def processar_powerbi(consulta, manter_linhas=False, amostra=50, page_size=None, medir_memoria=False):
+    """Como processar_planilha, lendo as vendas de uma powerbi.ConsultaPowerBI. Devolve um Processamento."""
+    preview = []
+    def blocos():
+        for bloco in (consulta.blocos(page_size) if page_size else consulta.blocos()):
+            if amostra and not preview:
+                preview.append(bloco.head(amostra))
+            yield bloco
+    def calcular():
+        return calcular_resultados(blocos(), manter_linhas=manter_linhas)
+    resultado, pico = _com_pico_memoria(calcular) if medir_memoria else (calcular(), None)
+    return Processamento(consulta.tabela, consulta.coluna_vendedor, consulta.coluna_valor, consulta.linhas_lidas,
+                         preview[0] if preview else None, resultado, pico)
+
+def resultados_para_linhas(df_results):
+    """Converte o DataFrame de resultados nas linhas (dicts) usadas pelo pdfgen; NaN vira None."""
+    return df_results.astype(object).where(df_results.notna(), None).to_dict('records')
@@ -1,21 +1,195 @@
+"""Vendas lidas direto de um dataset do Power BI (REST executeQueries).
 
-# Placeholder module to fetch data from Power BI via REST API.
-# To use, configure Azure AD app and set environment variables. Implement functions as needed.
+Usa um app do Azure AD (client credentials). As URLs de login e da API são
+configuráveis (POWERBI_AUTHORITY_URL / POWERBI_API_URL), o que permite testar
+contra um servidor HTTP local. Os resultados são paginados com TOPNSKIP e
+entregues em blocos com as mesmas colunas da leitura de planilha (`linha`,
+`vendedor`, `valor`), prontos para pipeline.calcular_resultados:
+
+    client = PowerBIClient.from_env()
+    consulta = ConsultaPowerBI(client, dataset_id, 'Vendas', 'Vendedor', 'Valor', 'Id')
+    resultado = calcular_resultados(consulta.blocos())
+"""
 import os
+import threading
+import time
+import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+AUTHORITY_URL = os.environ.get("POWERBI_AUTHORITY_URL", "https://login.microsoftonline.com")
+API_URL = os.environ.get("POWERBI_API_URL", "https://api.powerbi.com/v1.0/myorg")
+SCOPE = 'https://analysis.windows.net/powerbi/api/.default'
+# executeQueries devolve no máximo 100 mil linhas / 1 milhão de valores por consulta
+# e trunca o que passar disso; cada linha da consulta tem 3 colunas
+MAX_PAGE_SIZE = min(100_000, 1_000_000 // 3)
+PAGE_SIZE = min(int(os.environ.get("POWERBI_PAGE_SIZE", "50000")), MAX_PAGE_SIZE)
+POOL_SIZE = int(os.environ.get("POWERBI_POOL_SIZE", "4"))
+# renova o token um pouco antes de expirar
+TOKEN_MARGIN_SECONDS = 60
+
+_session = None
+_session_lock = threading.Lock()
+# (authority, tenant, client_id) -> (token, expira_em)
+_tokens = {}
+_tokens_lock = threading.Lock()
 
-def get_access_token(tenant_id, client_id, client_secret):
-    url = f'https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token'
+class PowerBIError(RuntimeError):
+    pass
+
+def get_session():
+    """Session HTTP compartilhada (keep-alive + pool de conexões, retry em 429/5xx)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=None, respect_retry_after_header=True)
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+            s.mount('https://', adapter)
+            s.mount('http://', adapter)
+            _session = s
+        return _session
+
+def get_access_token(tenant_id, client_id, client_secret, authority_url=None, session=None):
+    """Token de acesso (client credentials), reaproveitado até perto de expirar."""
+    authority_url = (authority_url or AUTHORITY_URL).rstrip('/')
+    key = (authority_url, tenant_id, client_id)
+    with _tokens_lock:
+        cached = _tokens.get(key)
+        if cached and cached[1] > time.time():
+            return cached[0]
+    url = f'{authority_url}/{tenant_id}/oauth2/v2.0/token'
     data = {
         'grant_type':'client_credentials',
         'client_id':client_id,
         'client_secret':client_secret,
-        'scope':'https://analysis.windows.net/powerbi/api/.default'
+        'scope':SCOPE
     }
-    r = requests.post(url, data=data)
+    r = (session or get_session()).post(url, data=data, timeout=30)
     r.raise_for_status()
-    return r.json().get('access_token')
+    body = r.json()
+    token = body.get('access_token')
+    if token:
+        expira = time.time() + int(body.get('expires_in', 3600)) - TOKEN_MARGIN_SECONDS
+        with _tokens_lock:
+            _tokens[key] = (token, expira)
+    return token
+
+def invalidate_token(tenant_id, client_id, authority_url=None):
+    with _tokens_lock:
+        _tokens.pop(((authority_url or AUTHORITY_URL).rstrip('/'), tenant_id, client_id), None)
+
+def _coluna(nome):
+    # chave das linhas: 'Tabela[Coluna]' ou '[coluna]' -> 'Coluna' / 'coluna'
+    return nome[nome.index('[') + 1:-1] if nome.endswith(']') and '[' in nome else nome
+
+class PowerBIClient:
+    """Cliente da API REST do Power BI para consultas DAX (executeQueries)."""
+
+    def __init__(self, tenant_id, client_id, client_secret, api_url=None, authority_url=None, session=None, timeout=120):
+        self.tenant_id = tenant_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.api_url = (api_url or API_URL).rstrip('/')
+        self.authority_url = authority_url or AUTHORITY_URL
+        self.session = session or get_session()
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Credenciais de POWERBI_TENANT_ID, POWERBI_CLIENT_ID e POWERBI_CLIENT_SECRET."""
+        faltando = [v for v in ("POWERBI_TENANT_ID", "POWERBI_CLIENT_ID", "POWERBI_CLIENT_SECRET") if not os.environ.get(v)]
+        if faltando:
+            raise PowerBIError(f"variáveis de ambiente ausentes: {', '.join(faltando)}")
+        return cls(os.environ["POWERBI_TENANT_ID"], os.environ["POWERBI_CLIENT_ID"], os.environ["POWERBI_CLIENT_SECRET"], **kwargs)
+
+    def token(self):
+        return get_access_token(self.tenant_id, self.client_id, self.client_secret, self.authority_url, self.session)
+
+    def execute_query(self, dataset_id, dax, workspace_id=None):
+        """Executa uma consulta DAX e devolve as linhas (lista de dicts, chaves sem o nome da tabela)."""
+        base = f"{self.api_url}/groups/{workspace_id}" if workspace_id else self.api_url
+        url = f"{base}/datasets/{dataset_id}/executeQueries"
+        body = {'queries': [{'query': dax}], 'serializerSettings': {'includeNulls': True}}
+        for tentativa in (1, 2):
+            r = self.session.post(url, json=body, headers={'Authorization': f'Bearer {self.token()}'}, timeout=self.timeout)
+            if r.status_code == 401 and tentativa == 1:
+                # token revogado/expirado antes do previsto: pede outro uma vez
+                invalidate_token(self.tenant_id, self.client_id, self.authority_url)
+                continue
+            break
+        if r.status_code >= 400:
+            raise PowerBIError(f"executeQueries HTTP {r.status_code}: {r.text[:500]}")
+        data = r.json()
+        if data.get('error'):
+            raise PowerBIError(f"executeQueries: {data['error']}")
+        resultado = data['results'][0]
+        if resultado.get('error'):
+            raise PowerBIError(f"executeQueries: {resultado['error']}")
+        tabelas = resultado.get('tables') or [{}]
+        return [{_coluna(k): v for k, v in row.items()} for row in tabelas[0].get('rows', [])]
+
+def _tabela_dax(nome):
+    return "'" + nome.replace("'", "''") + "'"
+
+def _coluna_dax(tabela, coluna):
+    return f"{_tabela_dax(tabela)}[{coluna.replace(']', ']]')}]"
+
+class ConsultaPowerBI:
+    """Vendas de uma tabela do dataset, paginadas em blocos como a LeituraPlanilha.
+
+    `coluna_ordem` deve identificar cada linha (ex.: id da venda): a paginação
+    com TOPNSKIP depende de uma ordem estável. `linhas_lidas` conta as linhas
+    recebidas até o momento.
+    """
+
+    def __init__(self, client, dataset_id, tabela, coluna_vendedor, coluna_valor, coluna_ordem, workspace_id=None):
+        self.client = client
+        self.dataset_id = dataset_id
+        self.workspace_id = workspace_id
+        self.tabela = tabela
+        self.coluna_vendedor = coluna_vendedor
+        self.coluna_valor = coluna_valor
+        self.coluna_ordem = coluna_ordem
+        self.linhas_lidas = 0
+
+    def dax(self, skip, n):
+        t = self.tabela
+        colunas = (f'SELECTCOLUMNS({_tabela_dax(t)}, "vendedor", {_coluna_dax(t, self.coluna_vendedor)}, '
+                   f'"valor", {_coluna_dax(t, self.coluna_valor)}, "ordem", {_coluna_dax(t, self.coluna_ordem)})')
+        return f"EVALUATE TOPNSKIP({int(n)}, {int(skip)}, {colunas}, [ordem], ASC) ORDER BY [ordem] ASC"
+
+    def blocos(self, page_size=PAGE_SIZE):
+        """DataFrames com colunas `linha` (1 = primeira linha do resultado), `vendedor` e `valor`.
+
+        `page_size` acima de MAX_PAGE_SIZE é reduzido: uma página truncada pela
+        API seria lida como a última.
+        """
+        page_size = min(page_size, MAX_PAGE_SIZE)
+        skip = 0
+        while True:
+            rows = self.client.execute_query(self.dataset_id, self.dax(skip, page_size), self.workspace_id)
+            if rows:
+                df = pd.DataFrame({
+                    'linha': range(skip + 1, skip + len(rows) + 1),
+                    'vendedor': [r.get('vendedor') for r in rows],
+                    'valor': [r.get('valor') for r in rows],
+                })
+                skip += len(rows)
+                self.linhas_lidas = skip
+                vazio = df['vendedor'].isna() & df['valor'].isna()
+                yield df[~vazio].reset_index(drop=True) if vazio.any() else df
+            if len(rows) < page_size:
+                return
+
+def export_dataset(workspace_id, dataset_id, token=None, tabela='Vendas', coluna_vendedor='Vendedor', coluna_valor='Valor',
+                   coluna_ordem='Id', page_size=PAGE_SIZE):
+    """Vendas do dataset em blocos (gerador), com credenciais das variáveis de ambiente.
 
-def export_dataset(workspace_id, dataset_id, token):
-    # implement runQueries or export API as needed
-    raise NotImplementedError('Customize this function to query your dataset.')
+    `token` é aceito por compatibilidade e ignorado: o cliente obtém e renova o
+    token sozinho.
+    """
+    consulta = ConsultaPowerBI(PowerBIClient.from_env(), dataset_id, tabela, coluna_vendedor, coluna_valor, coluna_ordem, workspace_id)
+    return consulta.blocos(page_size)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# módulos do app ficam na raiz do repositório (layout plano)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
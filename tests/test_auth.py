@@ -0,0 +1,49 @@
+import sqlite3
+
+import pytest
+
+import auth
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(auth, 'DB_PATH', tmp_path / 'system.db')
+    monkeypatch.setattr(auth, 'BCRYPT_ROUNDS', 4)
+    yield tmp_path / 'system.db'
+    auth.close_pool()
+    auth.invalidate_metas_cache()
+
+def _banco_antigo(path, metas):
+    # esquema anterior: metas sem vendedor_chave, casadas pelo nome exato
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE metas (id INTEGER PRIMARY KEY AUTOINCREMENT, vendedor TEXT NOT NULL,
+                    meta_min REAL, meta_100 REAL, gratificacao_100 REAL, bonus_pct REAL)""")
+    conn.executemany("INSERT INTO metas (vendedor, meta_100) VALUES (?, ?)", metas)
+    conn.commit()
+    conn.close()
+
+def test_migracao_guarda_conflitos(db):
+    _banco_antigo(db, [('João', 1.0), ('joao', 2.0), ('Ana', 3.0)])
+    auth.init_db()
+    auth.init_db()
+    assert sorted((m['vendedor'], m['meta_100']) for m in auth.list_metas()) == [('Ana', 3.0), ('João', 1.0)]
+    conflitos = auth.list_metas_conflitos()
+    assert [(c['vendedor'], c['meta_100'], c['mantida_meta_100']) for c in conflitos] == [('joao', 2.0, 1.0)]
+
+    auth.resolver_meta_conflito(conflitos[0]['id'], aplicar=True)
+    assert auth.get_metas(['JOÃO'])['JOÃO']['meta_100'] == 2.0
+    assert auth.list_metas_conflitos() == []
+
+def test_descartar_conflito(db):
+    _banco_antigo(db, [('Ana', 1.0), ('ana ', 2.0)])
+    auth.init_db()
+    auth.resolver_meta_conflito(auth.list_metas_conflitos()[0]['id'], aplicar=False)
+    assert auth.get_meta('ANA')['meta_100'] == 1.0
+    assert auth.list_metas_conflitos() == []
+
+def test_set_meta_usa_nome_normalizado(db):
+    auth.init_db()
+    auth.set_meta("João Silva", 0, 10000, 500, 0.1)
+    auth.set_meta("joao  silva", None, 20000, None, None)
+    metas = auth.list_metas()
+    assert len(metas) == 1
+    assert (metas[0]['meta_100'], metas[0]['gratificacao_100']) == (20000.0, 500.0)
@@ -0,0 +1,63 @@
+import math
+import random
+
+import numpy as np
+
+from calculo import calcular_gratificacao, calcular_gratificacao_lote, arredondar
+
+CAMPOS = ['atingimento', 'grat_base', 'bonus', 'total']
+
+def _comparar(casos):
+    lote = calcular_gratificacao_lote(*(list(c) for c in zip(*casos)))
+    for caso, linha in zip(casos, lote.to_dict('records')):
+        esperado = calcular_gratificacao(*caso)
+        for campo in CAMPOS:
+            obtido = linha[campo]
+            if esperado[campo] is None:
+                assert math.isnan(obtido), (caso, campo)
+            else:
+                assert obtido == esperado[campo], (caso, campo, obtido, esperado[campo])
+
+def test_casos_especiais():
+    _comparar([
+        (None, 0.0, 1000.0, 100.0, 0.1),      # sem vendas
+        (500.0, 0.0, None, 100.0, 0.1),       # sem meta 100%
+        (500.0, 0.0, 1000.0, None, 0.1),      # sem gratificação
+        (500.0, 0.0, 0.0, 100.0, 0.1),        # meta zero
+        (500.0, 600.0, 1000.0, 100.0, 0.1),   # abaixo da meta mínima
+        (500.0, None, 1000.0, 100.0, 0.1),    # meta mínima ausente não bloqueia
+        (1500.0, 0.0, 1000.0, 100.0, None),   # acima da meta sem bônus
+        (1500.0, 0.0, 1000.0, 100.0, 0.1),
+        (1000.0, 1000.0, 1000.0, 100.0, 0.1), # exatamente na meta
+        (-50.0, None, 1000.0, 100.0, 0.1),    # devolução
+    ])
+
+def test_empates_de_arredondamento():
+    # valores em ...5 onde np.round e round() do Python divergem
+    casos = [(v, 0.0, 1.0, 1.0, 0.5) for v in (1.005, 2.675, 0.125, 1.00005, 0.28345, 1.015, 4.445)]
+    casos += [(1000.0 + v, 0.0, 1000.0, 1.0, 1.0) for v in (0.005, 0.015, 0.125, 0.675)]
+    _comparar(casos)
+    valores = [0.5, 1.5, 2.5, 2.675, 1.005, -0.125, 1e16 + 0.5]
+    for casas in (0, 2, 3):
+        assert list(arredondar(valores, casas)) == [round(v, casas) for v in valores]
+
+def test_aleatorio_igual_ao_escalar():
+    rnd = random.Random(1234)
+    def talvez(v, p=0.1):
+        return None if rnd.random() < p else v
+    casos = []
+    for _ in range(20_000):
+        meta_100 = rnd.choice([0.0, 1000.0, 2500.0, round(rnd.uniform(1, 50_000), 2)])
+        casos.append((talvez(round(rnd.uniform(-1000, 100_000), rnd.choice([0, 2, 3]))),
+                      talvez(round(rnd.uniform(0, 20_000), 2), 0.3),
+                      talvez(meta_100),
+                      talvez(round(rnd.uniform(0, 2_000), 2)),
+                      talvez(rnd.choice([0.0, 0.01, 0.05, 0.1, 0.125]), 0.3)))
+    _comparar(casos)
+
+def test_escalares_replicados():
+    lote = calcular_gratificacao_lote([500.0, 1500.0], 0.0, 1000.0, 100.0, 0.1)
+    assert list(lote['total']) == [calcular_gratificacao(v, 0.0, 1000.0, 100.0, 0.1)['total'] for v in (500.0, 1500.0)]
+
+def test_lote_vazio():
+    assert len(calcular_gratificacao_lote(np.array([]), [], [], [], [])) == 0
@@ -0,0 +1,79 @@
+import socket
+
+import pytest
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+from emailer import BulkMailer, build_message
+
+class _Handler:
+    """Servidor SMTP de teste: 451 na primeira tentativa de retry@, 550 sempre para bloqueado@."""
+
+    def __init__(self):
+        self.mensagens = []
+        self.sessoes = set()
+        self.recusados = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith('retry@') and address not in self.recusados:
+            self.recusados.add(address)
+            return '451 4.3.0 tente mais tarde'
+        if address.startswith('bloqueado@'):
+            return '550 5.1.1 caixa inexistente'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessoes.add(session.peer)
+        self.mensagens.append(envelope.rcpt_tos[:])
+        return '250 OK'
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+@pytest.fixture
+def smtp():
+    handler = _Handler()
+    controller = aiosmtpd_controller.Controller(handler, hostname='127.0.0.1', port=_porta_livre())
+    controller.start()
+    try:
+        yield handler, controller
+    finally:
+        controller.stop()
+
+def _mailer(controller):
+    return BulkMailer(controller.hostname, controller.port, '', '', connections=2, rate_per_sec=0,
+                      max_retries=2, backoff=0.01, starttls=False, timeout=5)
+
+def _msg(to):
+    return build_message('rel@example.com', to, 'Demonstrativo', 'corpo', attachment=b'%PDF-1.4 teste', attachment_name='d.pdf')
+
+def test_reutiliza_sessoes(smtp):
+    handler, controller = smtp
+    with _mailer(controller) as mailer:
+        status = mailer.send_all([_msg(f'v{i}@example.com') for i in range(8)])
+    assert all(s['ok'] and s['attempts'] == 1 for s in status)
+    assert [s['to'] for s in status] == [f'v{i}@example.com' for i in range(8)]
+    assert len(handler.mensagens) == 8
+    # uma sessão por conexão do pool, não uma por mensagem
+    assert len(handler.sessoes) <= 2
+
+def test_repete_em_erro_temporario(smtp):
+    handler, controller = smtp
+    with _mailer(controller) as mailer:
+        status = mailer.send(_msg('retry@example.com'))
+    assert status['ok'] and status['attempts'] == 2
+    assert handler.mensagens == [['retry@example.com']]
+
+def test_nao_repete_erro_permanente(smtp):
+    handler, controller = smtp
+    with _mailer(controller) as mailer:
+        status = mailer.send(_msg('bloqueado@example.com'))
+        depois = mailer.send(_msg('ok@example.com'))
+    assert not status['ok'] and status['attempts'] == 1
+    assert 'SMTPRecipientsRefused' in status['error']
+    # a sessão continua válida depois da recusa
+    assert depois['ok'] and depois['attempts'] == 1
+    assert handler.mensagens == [['ok@example.com']]
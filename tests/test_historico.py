@@ -0,0 +1,25 @@
+import pytest
+
+import auth
+import historico
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(auth, 'DB_PATH', tmp_path / 'system.db')
+    monkeypatch.setattr(auth, 'BCRYPT_ROUNDS', 4)
+    auth.init_db()
+    yield
+    auth.close_pool()
+
+def test_recusa_execucao_sem_resultados(db):
+    with pytest.raises(ValueError):
+        historico.salvar_execucao('2026-01', [])
+    assert historico.listar_execucoes() == []
+    assert historico.totais_por_periodo() == []
+
+def test_salvar_substitui_o_periodo(db):
+    historico.salvar_execucao('2026-01', [{'vendedor': 'Ana', 'vendas': 100.0, 'total': 10.0, 'linhas': 2}])
+    historico.salvar_execucao('2026-01', [{'vendedor': 'Ana', 'vendas': 200.0, 'total': 20.0, 'linhas': 3},
+                                         {'vendedor': 'Bia', 'vendas': 50.0, 'total': 5.0, 'linhas': 1}])
+    assert [(e['periodo'], e['total'], e['vendedores']) for e in historico.listar_execucoes()] == [('2026-01', 25.0, 2)]
+    assert [(p['periodo'], p['total'], p['vendedores']) for p in historico.totais_por_periodo()] == [('2026-01', 25.0, 2)]
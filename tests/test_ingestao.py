@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from ingestao import converter_valores
+
+@pytest.mark.parametrize('valor, esperado', [
+    ('R$ 1.234,56', 1234.56),
+    ('R$1.234,56', 1234.56),
+    ('1.234', 1234.0),
+    ('12.345.678,90', 12345678.9),
+    ('1234,56', 1234.56),
+    ('  150 ', 150.0),
+    ('(1.234,56)', -1234.56),
+    ('R$ (10,00)', -10.0),
+    ('-5,5', -5.5),
+    (1234.56, 1234.56),
+    (7, 7.0),
+    (np.float64(2.5), 2.5),
+])
+def test_valores_validos(valor, esperado):
+    out, invalidos = converter_valores([valor])
+    assert out[0] == pytest.approx(esperado)
+    assert not invalidos[0]
+
+@pytest.mark.parametrize('valor', ['', '-', '–', '—', '  ', None])
+def test_vazios_nao_sao_invalidos(valor):
+    out, invalidos = converter_valores([valor])
+    assert np.isnan(out[0])
+    assert not invalidos[0]
+
+@pytest.mark.parametrize('valor', [
+    '1.5', '1234.56', 'R$ 1,234.56', '1.23', '12.3456',
+    '(12', '12)', '((12))', '(-5)', 'abc', '1,2,3',
+])
+def test_valores_invalidos(valor):
+    out, invalidos = converter_valores([valor])
+    assert np.isnan(out[0])
+    assert invalidos[0]
+
+def test_coluna_mista():
+    out, invalidos = converter_valores(['R$ 1.000,00', 250, '-', 'x', '(50)'])
+    np.testing.assert_allclose(out, [1000.0, 250.0, np.nan, np.nan, -50.0])
+    assert invalidos.tolist() == [False, False, False, True, False]
@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+import auth
+import pipeline
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(auth, 'DB_PATH', tmp_path / 'system.db')
+    monkeypatch.setattr(auth, 'BCRYPT_ROUNDS', 4)
+    auth.init_db()
+    auth.invalidate_metas_cache()
+    yield
+    auth.close_pool()
+    auth.invalidate_metas_cache()
+
+def _planilha(path, linhas):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['VENDEDOR', 'VALOR DE VENDA'])
+    for linha in linhas:
+        ws.append(linha)
+    wb.save(path)
+    return path
+
+def test_pico_de_memoria_do_processamento(db, tmp_path):
+    arquivo = _planilha(tmp_path / 'vendas.xlsx', [(f'Vendedor {i % 5}', i * 10.0) for i in range(200)])
+    proc = pipeline.processar_planilha(str(arquivo), medir_memoria=True)
+    assert proc.linhas_lidas == 200
+    assert proc.pico_mb > 0
+    assert pipeline.processar_planilha(str(arquivo)).pico_mb is None
+
+def _resultado():
+    bloco = pd.DataFrame({'linha': [2, 3, 4, 5], 'vendedor': ['Ana', 'Bia', 'ana ', None],
+                          'valor': [6000.0, 8000.0, 6000.0, 100.0]})
+    return pipeline.calcular_resultados([bloco])
+
+def test_sincronizar_recalcula_so_o_vendedor_alterado(db):
+    auth.set_meta('Ana', 0, 10000, 500, 0.1)
+    auth.set_meta('Bia', 0, 10000, 500, 0.1)
+    resultado = _resultado()
+    assert resultado.resultados.at['ana', 'total'] == pytest.approx(700.0)
+    assert pipeline.sincronizar_metas(resultado) == (resultado, [])
+
+    auth.set_meta('ANA', 0, 20000, 500, 0.1)
+    publicados = []
+    novo, stale = pipeline.sincronizar_metas(resultado, publicar=publicados.append)
+    assert stale == ['ana']
+    assert publicados == [novo]
+    assert novo.resultados.at['ana', 'total'] == pytest.approx(300.0)
+    assert novo.resultados.at['bia', 'total'] == resultado.resultados.at['bia', 'total']
+    # copy-on-write: quem ainda tem o resultado antigo não o vê mudar
+    assert resultado.resultados.at['ana', 'total'] == pytest.approx(700.0)
+    assert pipeline.sincronizar_metas(novo) == (novo, [])
+
+def test_sincronizar_apos_mudanca_geral_recalcula_todos(db):
+    auth.set_meta('Ana', 0, 10000, 500, 0.1)
+    resultado = _resultado()
+    auth.invalidate_metas_cache()
+    assert auth.metas_changes_since(int(resultado.versoes.min())) is None
+    novo, stale = pipeline.sincronizar_metas(resultado)
+    assert sorted(stale) == ['', 'ana', 'bia']
+    assert (novo.versoes == auth.metas_version()).all()
+    pd.testing.assert_frame_equal(novo.resultados, resultado.resultados)
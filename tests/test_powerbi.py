@@ -0,0 +1,105 @@
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import auth
+import powerbi
+from pipeline import calcular_resultados
+
+class _PowerBIFalso(BaseHTTPRequestHandler):
+    """Login do Azure AD + executeQueries com TOPNSKIP, sobre self.server.linhas."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, corpo):
+        dados = json.dumps(corpo).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_POST(self):
+        srv = self.server
+        corpo = self.rfile.read(int(self.headers['Content-Length']))
+        if self.path.endswith('/oauth2/v2.0/token'):
+            srv.tokens_emitidos += 1
+            return self._json(200, {'access_token': f'tok{srv.tokens_emitidos}', 'expires_in': 3600})
+        srv.consultas.append(self.path)
+        token = self.headers.get('Authorization', '').removeprefix('Bearer ')
+        if token in srv.tokens_revogados or not token.startswith('tok'):
+            return self._json(401, {'error': {'code': 'TokenExpired'}})
+        dax = json.loads(corpo)['queries'][0]['query']
+        n, skip = map(int, re.search(r'TOPNSKIP\((\d+), (\d+),', dax).groups())
+        # como a API real, trunca o resultado no limite de linhas
+        n = min(n, srv.limite_linhas)
+        rows = [{'[vendedor]': v, '[valor]': valor, '[ordem]': i} for i, (v, valor) in enumerate(srv.linhas)][skip:skip + n]
+        return self._json(200, {'results': [{'tables': [{'rows': rows}]}]})
+
+@pytest.fixture
+def servidor():
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), _PowerBIFalso)
+    srv.linhas = [(f'Vendedor {i % 3}', f'R$ {i},50' if i % 4 == 0 else float(i)) for i in range(25)]
+    srv.limite_linhas = 100_000
+    srv.tokens_emitidos = 0
+    srv.tokens_revogados = set()
+    srv.consultas = []
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    try:
+        yield srv
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+def _consulta(srv):
+    url = f'http://127.0.0.1:{srv.server_port}'
+    client = powerbi.PowerBIClient('tenant', 'client', 'segredo', api_url=url, authority_url=url)
+    return powerbi.ConsultaPowerBI(client, 'ds', 'Vendas', 'Vendedor', 'Valor', 'Id', workspace_id='ws')
+
+def test_paginacao_com_um_token(servidor):
+    consulta = _consulta(servidor)
+    blocos = list(consulta.blocos(page_size=10))
+    assert [len(b) for b in blocos] == [10, 10, 5]
+    assert list(blocos[1]['linha']) == list(range(11, 21))
+    assert list(blocos[2]['vendedor']) == [v for v, _ in servidor.linhas[20:]]
+    assert consulta.linhas_lidas == 25
+    assert servidor.tokens_emitidos == 1
+    assert servidor.consultas == ['/groups/ws/datasets/ds/executeQueries'] * 3
+
+def test_pagina_exata_termina_com_consulta_vazia(servidor):
+    servidor.linhas = servidor.linhas[:20]
+    assert [len(b) for b in _consulta(servidor).blocos(page_size=10)] == [10, 10]
+    assert len(servidor.consultas) == 3
+
+def test_page_size_acima_do_limite_da_api(servidor, monkeypatch):
+    servidor.limite_linhas = 10
+    monkeypatch.setattr(powerbi, 'MAX_PAGE_SIZE', 10)
+    consulta = _consulta(servidor)
+    assert [len(b) for b in consulta.blocos(page_size=1_000_000)] == [10, 10, 5]
+    assert consulta.linhas_lidas == 25
+
+def test_renova_token_em_401(servidor):
+    consulta = _consulta(servidor)
+    consulta.client.token()
+    servidor.tokens_revogados.add('tok1')
+    assert sum(len(b) for b in consulta.blocos(page_size=100)) == 25
+    assert servidor.tokens_emitidos == 2
+
+def test_alimenta_o_calculo(servidor, tmp_path, monkeypatch):
+    monkeypatch.setattr(auth, 'DB_PATH', tmp_path / 'system.db')
+    monkeypatch.setattr(auth, 'BCRYPT_ROUNDS', 4)
+    auth.init_db()
+    auth.invalidate_metas_cache()
+    try:
+        resultado = calcular_resultados(_consulta(servidor).blocos(page_size=10))
+    finally:
+        auth.close_pool()
+    esperado = sum(i + 0.5 if i % 4 == 0 else i for i in range(25))
+    assert resultado.resultados['vendas'].sum() == pytest.approx(esperado)
+    assert resultado.resultados['linhas'].sum() == 25
+    assert len(resultado.invalidos) == 0